@@ -2,8 +2,12 @@ import itertools
 import re
 import os
 import asyncio
-from collections import deque
-from random import shuffle
+import json
+import sqlite3
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from random import shuffle, uniform
 import sys
 import traceback
 from typing import Optional, List
@@ -17,10 +21,12 @@ import humanize
 
 
 URL_REG = re.compile(r'https?://(?:www\.)?.+')
+YTID_REG = re.compile(r"^[a-zA-Z0-9_-]{11}$")
 
 # você pode obter lista de servidores lavalink no link abaixo:
 # https://lavalink.darrennathanael.com/SSL/lavalink-with-ssl/
 # ou hospede um próprio e preencha os dados conforme o modelo abaixo
+# (opcional: 'weight' aumenta a preferência pelo servidor, ex: 2 = recebe o dobro de prioridade)
 
 lavalink_servers = [
 
@@ -44,6 +50,62 @@ lavalink_servers = [
 
 ]
 
+# arquivo json com a lista de servidores (mesmo formato do lavalink_servers acima). quando o arquivo existir ele
+# substitui a lista acima e alterações nele são aplicadas sem reiniciar o bot: servidores novos são conectados e
+# servidores removidos param de receber players e são desconectados após os players serem movidos.
+# (None para usar apenas a lista acima)
+lavalink_file = "lavalink.json"
+lavalink_file_interval = 10  # intervalo (em segundos) para verificar alterações no arquivo
+# tempo máximo (em segundos) aguardando os players serem movidos para outro servidor antes de desconectar um servidor
+# removido/alterado (os players que não puderem ser movidos são finalizados)
+node_drain_timeout = 60
+
+# cache de buscas compartilhado entre todos os servidores (evita repetir a mesma busca no lavalink)
+search_cache_size = 2000  # quantidade máxima de buscas armazenadas
+search_cache_ttl = 3600  # tempo (em segundos) que uma busca fica armazenada
+
+# arquivo local (sqlite) onde as buscas ficam salvas entre reinicializações do bot (None para desativar)
+track_store_file = "track_cache.db"
+track_store_max_size = 50000  # quantidade máxima de buscas armazenadas no arquivo
+track_store_ttl = 86400  # tempo (em segundos) que uma busca salva no arquivo é usada antes de ser refeita
+
+# arquivo local (sqlite) onde o estado dos players é salvo para serem restaurados ao reiniciar o bot (None para desativar)
+player_store_file = "players.db"
+player_store_interval = 15  # intervalo (em segundos) entre os salvamentos (apenas os players alterados são salvos)
+player_restore_concurrency = 20  # quantidade de players restaurados ao mesmo tempo ao iniciar o bot
+player_store_max_age = 3600  # players salvos há mais tempo que isso (em segundos) não são restaurados
+
+# decodificação em lote dos ids das músicas salvas (usada ao restaurar os players)
+decode_chunk_size = 1000  # quantidade de ids enviados por requisição
+decode_concurrency = 4  # quantidade máxima de requisições simultâneas (compartilhada entre todos os servidores)
+decode_split_depth = 10  # vezes que um lote com id inválido pode ser dividido (1000 ids -> 1 id)
+decode_split_limit = 40  # divisões de lotes permitidas por decodificação (ex: ids de outra versão do lavalink)
+
+# quantidade de músicas de uma playlist que são criadas ao adicionar (o restante é criado conforme a fila avança)
+playlist_preload = 100
+
+# intervalo (em segundos) para verificar servidores offline/em manutenção e mover seus players para outro servidor
+node_check_interval = 5
+
+# verificação de saúde dos servidores de música
+node_probe_interval = 30  # intervalo (em segundos) entre as verificações de um servidor conectado
+node_probe_timeout = 10
+node_unhealthy_after = 2  # falhas seguidas para considerar o servidor indisponível
+node_backoff_base = 2  # espera inicial (em segundos) entre as tentativas de reconectar (dobra a cada falha)
+node_backoff_max = 300
+
+# servidores bloqueados pelo youtube (erro 429) deixam de receber players/buscas por um tempo
+node_block_threshold = 2  # quantidade de erros 429...
+node_block_window = 120  # ...dentro desse intervalo (em segundos) para bloquear o servidor
+node_block_cooldown = 900  # tempo (em segundos) que o servidor fica sem receber players/buscas
+
+# edições das mensagens dos players (passam por uma fila global compartilhada entre todos os servidores)
+message_edit_delay = 5  # tempo (em segundos) para agrupar várias atualizações do player em uma única edição
+message_edit_rate = 10  # quantidade máxima de edições por segundo (respostas de interações têm prioridade)
+
+# precisão (em segundos) dos timers dos players (tempo de inatividade, novas tentativas etc)
+timer_tick = 0.5
+
 
 def get_button_style(enabled: bool, red=True):
     if enabled:
@@ -119,7 +181,7 @@ def is_requester():
         if not ctx.player.current:
             raise NoSource()
 
-        if ctx.player.current.requester == ctx.author:
+        if ctx.player.current.requester_id == ctx.author.id:
             return True
 
         try:
@@ -229,558 +291,3121 @@ def seek_parser(time):
         return
 
 
+def normalize_query(query: str):
+
+    query = " ".join(query.split())
+
+    if query.startswith("ytsearch:"):
+        query = query.lower()
+
+    return query
+
+
 def get_track_index(ctx, query):
-    index = None
 
     player: CustomPlayer = ctx.player
 
-    for counter, track in enumerate(player.queue):
+    return player.queue.find(query)
 
-        if query.lower() in track.title.lower() or \
-                all(elem in track.title.lower().split() for elem in query.lower().split()):
-            index = counter
-            break
 
-    return index
+def trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
 
-########################
-### Classe de testes ###
-########################
+##########################
+##### Cache de buscas ####
+##########################
 
-class TestBot(commands.Bot):
+class TrackCache:
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    def __init__(self, max_size: int = 2000, ttl: int = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    async def setup_bot(self):
-        await self.wait_until_ready()
-        await self.tree.sync()
-        print(f'Logado como: {self.user} [{self.user.id}]')
+    def __len__(self):
+        return len(self.entries)
 
-    async def setup_hook(self):
-        await self.add_cog(Music(self))
-        self.loop.create_task(self.setup_bot())
+    def get(self, key: str):
 
+        try:
+            expires, value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return
 
-##################
-##### Errors #####
-##################
+        if expires < time.monotonic():
+            del self.entries[key]
+            self.evictions += 1
+            self.misses += 1
+            return
 
-class NoPlayer(commands.CheckFailure):
-    pass
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
 
+    def put(self, key: str, value):
 
-class NoVoice(commands.CheckFailure):
-    pass
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
 
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
 
-class DiffVoiceChannel(commands.CheckFailure):
-    pass
 
+class TrackStore:
 
-class NoSource(commands.CheckFailure):
-    pass
+    def __init__(self, path: str, max_size: int = 50000, ttl: int = 86400, flush_interval: int = 5):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.touched = set()
+        self.flush_task: Optional[asyncio.Task] = None
+        # a conexão do sqlite é usada apenas pela thread do executor (fora do event loop)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.conn: Optional[sqlite3.Connection] = None
 
+    def _connect(self):
 
-class NotDJorStaff(commands.CheckFailure):
-    pass
+        if self.conn:
+            return
 
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tracks "
+                          "(query TEXT PRIMARY KEY, playlist TEXT, tracks TEXT NOT NULL, accessed REAL NOT NULL, "
+                          "created REAL NOT NULL DEFAULT 0)")
 
-class NotRequester(commands.CheckFailure):
-    pass
+        # arquivos criados antes da validade das buscas (as buscas antigas são consideradas expiradas)
+        if "created" not in [c[1] for c in self.conn.execute("PRAGMA table_info(tracks)")]:
+            self.conn.execute("ALTER TABLE tracks ADD COLUMN created REAL NOT NULL DEFAULT 0")
 
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tracks_accessed ON tracks (accessed)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tracks_created ON tracks (created)")
+        self.conn.commit()
 
-##############################
-##### Paginator Classes ######
-##############################
+    def _get(self, key: str):
 
-class QueueInteraction(discord.ui.View):
+        self._connect()
 
-    def __init__(self, player, user: discord.Member, timeout=60):
+        row = self.conn.execute("SELECT playlist, tracks FROM tracks WHERE query = ? AND created >= ?",
+                                (key, time.time() - self.ttl)).fetchone()
 
-        self.player = player
-        self.user = user
-        self.pages = []
-        self.current = 0
-        self.max_page = len(self.pages) - 1
-        super().__init__(timeout=timeout)
-        self.embed = discord.Embed(color=user.guild.me.colour)
-        self.update_pages()
-        self.update_embed()
+        if not row:
+            return
 
-    def update_pages(self):
+        return json.loads(row[0]) if row[0] else None, [tuple(t) for t in json.loads(row[1])]
 
-        counter = 1
+    def _write(self, entries: dict, touched: set):
 
-        entries = list(self.player.queue)
+        self._connect()
 
-        self.pages = [entries[i:i + 8] for i in range(0, len(entries), 8)]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO tracks (query, playlist, tracks, accessed, created) VALUES (?, ?, ?, ?, ?)",
+            [(k, json.dumps(v[0]) if v[0] else None, json.dumps(v[1]), a, a) for k, (v, a) in entries.items()]
+        )
 
-        for n, page in enumerate(self.pages):
+        now = time.time()
+        self.conn.executemany("UPDATE tracks SET accessed = ? WHERE query = ?", [(now, k) for k in touched])
+        self.conn.execute("DELETE FROM tracks WHERE created < ?", (now - self.ttl,))
 
-            txt = "\n"
-            for t in page:
-                txt += f"`{counter})` [`{fix_characters(t.title, limit=50)}`]({t.uri})\n" \
-                       f"`[{time_format(t.duration) if not t.is_stream else '🔴 Livestream'}]`" + \
-                       f" - {t.requester.mention}\n`---------`\n"
+        count = self.conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
 
-                counter += 1
+        if count > self.max_size:
+            self.conn.execute("DELETE FROM tracks WHERE query IN "
+                              "(SELECT query FROM tracks ORDER BY accessed LIMIT ?)", (count - self.max_size,))
 
-            self.pages[n] = txt
+        self.conn.commit()
 
-        self.current = 0
-        self.max_page = len(self.pages) - 1
+    async def get(self, key: str):
 
-    def update_embed(self):
-        self.embed.title = f"**Músicas na fila [{self.current + 1} / {self.max_page + 1}]**"
-        self.embed.description = self.pages[self.current]
+        try:
+            return self.pending[key][0]
+        except KeyError:
+            pass
 
-    @discord.ui.button(emoji='⏮️', style=discord.ButtonStyle.grey)
-    async def first(self, interaction: discord.Interaction, button):
+        result = await asyncio.get_running_loop().run_in_executor(self.executor, self._get, key)
 
-        self.current = 0
-        self.update_embed()
-        await interaction.response.edit_message(embed=self.embed)
+        if result:
+            self.touched.add(key)
+            self.schedule_flush()
 
-    @discord.ui.button(emoji='⬅️', style=discord.ButtonStyle.grey)
-    async def back(self, interaction: discord.Interaction, button):
+        return result
 
-        if self.current == 0:
-            self.current = self.max_page
-        else:
-            self.current -= 1
-        self.update_embed()
-        await interaction.response.edit_message(embed=self.embed)
+    def put(self, key: str, value):
+        self.pending[key] = (value, time.time())
+        self.schedule_flush()
 
-    @discord.ui.button(emoji='➡️', style=discord.ButtonStyle.grey)
-    async def next(self, interaction: discord.Interaction, button):
+    def schedule_flush(self):
 
-        if self.current == self.max_page:
-            self.current = 0
-        else:
-            self.current += 1
-        self.update_embed()
-        await interaction.response.edit_message(embed=self.embed)
+        if self.flush_task:
+            return
 
-    @discord.ui.button(emoji='⏭️', style=discord.ButtonStyle.grey)
-    async def last(self, interaction: discord.Interaction, button):
+        self.flush_task = asyncio.get_running_loop().create_task(self.flush_later())
 
-        self.current = self.max_page
-        self.update_embed()
-        await interaction.response.edit_message(embed=self.embed)
+    async def flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self.flush_task = None
+        await self.flush()
 
-    @discord.ui.button(emoji='⏹️', style=discord.ButtonStyle.grey)
-    async def stop_interaction(self, interaction: discord.Interaction, button):
+    async def flush(self):
 
-        await interaction.response.edit_message(content="Queue fechada", embed=None, view=None)
-        self.stop()
+        if not self.pending and not self.touched:
+            return
 
-    @discord.ui.button(emoji='🔄', label="Recarregar lista", style=discord.ButtonStyle.grey)
-    async def update_q(self, interaction: discord.Interaction, button):
+        entries, self.pending = self.pending, {}
+        touched, self.touched = self.touched, set()
 
-        self.update_pages()
-        self.update_embed()
-        await interaction.response.edit_message(embed=self.embed)
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._write, entries, touched)
+        except Exception:
+            traceback.print_exc()
 
+    async def close(self):
 
-##########################
-##### Music Classes ######
-##########################
+        try:
+            self.flush_task.cancel()
+        except AttributeError:
+            pass
 
-class PlayerInteractions(discord.ui.View):
+        self.flush_task = None
 
-    def __init__(self, ctx):
-        self.ctx = ctx
+        await self.flush()
 
-        super().__init__(timeout=None)
+        if self.conn:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.conn.close)
+            self.conn = None
 
-    async def interaction_check(self, interaction: discord.Interaction):
 
-        player = self.ctx.bot.music.players.get(interaction.guild.id)
+class PlayerStore:
 
-        if player.interaction_cooldown:
-            await interaction.response.send_message("O player está em cooldown, tente novamente em instantes.",
-                                                    ephemeral=True)
-            return
+    # estado dos players salvo periodicamente para ser restaurado caso o bot reinicie/caia. apenas os players
+    # alterados desde o último salvamento são gravados e a fila só é regravada quando for alterada.
+    # as músicas são salvas apenas como [id codificado, id de quem pediu].
 
-        vc = self.ctx.bot.get_channel(player.channel_id)
+    def __init__(self, path: str, max_age: int = 3600):
+        self.path = path
+        self.max_age = max_age
+        self.saved = {}  # guild_id -> (estado, fila, versão da fila) do último salvamento
+        self.last_touch = time.monotonic()
+        # a conexão do sqlite é usada apenas pela thread do executor (fora do event loop)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.conn: Optional[sqlite3.Connection] = None
 
-        if interaction.user not in vc.members:
-            embed = discord.Embed(
-                description=f"Você deve estar no canal <#{vc.id}> para usar isto.",
-                color=discord.Colour.red()
-            )
+    def _connect(self):
 
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+        if self.conn:
             return
 
-        control = interaction.data.get("custom_id")[12:]
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS players "
+                          "(guild_id INTEGER PRIMARY KEY, state TEXT NOT NULL, queue TEXT, updated REAL NOT NULL)")
+        self.conn.commit()
 
-        kwargs = {}
-
-        if control == "help":
-            embed = discord.Embed(
-                description=f"📘 **IFORMAÇÕES SOBRE OS BOTÕES** 📘\n\n"
-                            f"⏯️ `= Pausar/Retomar a música`\n"
-                            f"⏮️ `= Voltar para a música tocada anteriormente`\n"
-                            f"⏭️ `= Pular para a próxima música`\n"
-                            f"⏪ `= Voltar o tempo da música em 20 seg.`\n"
-                            f"⏩ `= Avançar o tempo da música em 20 seg.`\n"
-                            f"⏹️ `= Parar o player e me desconectar do canal`\n"
-                            f"🔀 `= Misturar as músicas da fila`\n"
-                            f"🇳 `= Ativar/Desativar o efeito Nightcore`\n"
-                            f"🔁 `= Ativar/Desativar repetição da música`",
-                color=self.ctx.me.color
-            )
+    def _load(self):
 
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            return
+        self._connect()
 
-        elif control == "fastbackward":
-            control = "seek"
-            kwargs = {"pos": time_format(player.position - 20000)}
+        # players salvos há muito tempo (ex: bot desligado por dias) não devem voltar a tocar sozinhos
+        self.conn.execute("DELETE FROM players WHERE updated < ?", (time.time() - self.max_age,))
+        self.conn.commit()
 
-        elif control == "fastforward":
-            control = "seek"
-            kwargs = {"pos": time_format(player.position + 20000)}
+        return [(guild_id, json.loads(state), json.loads(queue) if queue else [])
+                for guild_id, state, queue in self.conn.execute("SELECT guild_id, state, queue FROM players")]
 
-        elif control == "playpause":
-            control = "pause" if not player.paused else "resume"
+    def _write(self, rows: list, removed: list, touched: list = ()):
 
-        elif control == "loop":
-            if player.loop == "current":
-                control = "loopqueue"
-            elif player.loop == "queue":
-                pass
-            else:
-                player.loop = False
+        self._connect()
+
+        now = time.time()
+
+        # players sem alterações continuam ativos (não podem ser considerados antigos na restauração)
+        self.conn.executemany("UPDATE players SET updated = ? WHERE guild_id = ?", [(now, g) for g in touched])
+
+        # fila None = não foi alterada desde o último salvamento (mantém a salva)
+        self.conn.executemany(
+            "INSERT INTO players (guild_id, state, queue, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (guild_id) DO UPDATE SET state = excluded.state, "
+            "queue = COALESCE(excluded.queue, players.queue), updated = excluded.updated",
+            [(g, json.dumps(state), json.dumps(queue) if queue is not None else None, now) for g, state, queue in rows]
+        )
+
+        self.conn.executemany("DELETE FROM players WHERE guild_id = ?", [(g,) for g in removed])
+
+        self.conn.commit()
 
-        ctx = await player.bot.get_context(interaction.message)
-        cmd: commands.Command = player.bot.get_command(control)
+    async def load(self):
+        # os players que não forem restaurados (ex: nenhum servidor de música disponível a tempo) continuam salvos
+        # no arquivo. apenas os players salvos por esta sessão e finalizados depois são removidos.
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._load)
 
-        ctx.command = cmd
-        ctx.player = player
-        ctx.author = interaction.user
-        ctx.interaction = interaction
-        ctx.channel = interaction.channel
+    async def save(self, players):
+
+        rows = []
+        saved = {}
+
+        for player in players:
+
+            if not player.current and not player.queue:
+                continue  # players sem músicas (ex: aguardando novas músicas) não são restaurados
+
+            state = player.snapshot()
+            last = self.saved.get(player.guild_id)
+            queue_changed = not last or last[1] is not player.queue or last[2] != player.queue.version
+
+            saved[player.guild_id] = (state, player.queue, player.queue.version)
+
+            if queue_changed or last[0] != state:
+                rows.append((player.guild_id, state, player.queue.snapshot() if queue_changed else None))
+
+        removed = [g for g in self.saved if g not in saved]
+        touched = []
+
+        if time.monotonic() - self.last_touch > self.max_age / 4:
+            touched = [g for g in saved if g not in {r[0] for r in rows}]
+
+        if rows or removed or touched:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._write, rows, removed, touched)
+
+        if touched:
+            self.last_touch = time.monotonic()
+
+        self.saved = saved
+
+    async def discard(self, guild_id: int):
+
+        # remove um player salvo que não pode mais ser restaurado (servidor/canal removido, canal vazio etc)
+        if guild_id not in self.saved:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._write, [], [guild_id])
+
+    async def close(self, players):
 
         try:
+            await self.save(players)
+        except Exception:
+            traceback.print_exc()
 
-            bucket = cmd._buckets.get_bucket(ctx)
-            if bucket:
-                retry_after = bucket.update_rate_limit()
-                if retry_after:
-                    raise commands.CommandOnCooldown(cooldown=bucket, retry_after=retry_after, type=cmd._buckets.type)
+        if self.conn:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.conn.close)
+            self.conn = None
 
-            await cmd(ctx, **kwargs)
 
-            player.interaction_cooldown = True
-            await asyncio.sleep(1)
-            player.interaction_cooldown = False
+##############################
+#### Servidores de música ####
+##############################
 
-        except Exception as e:
-            await ctx.cog.cog_command_error(ctx, e)
+class NodeHealth:
 
+    def __init__(self):
+        self.rest_latency: Optional[float] = None  # média móvel do tempo de resposta da api rest (ms)
+        self.results = deque(maxlen=50)  # resultado das últimas requisições (True = sucesso)
+        self.healthy = False
+        self.probe_rtt: Optional[float] = None  # tempo de resposta da última verificação (ms)
+        self.probe_failures = 0  # falhas seguidas nas verificações
+        self.last_probe: Optional[float] = None
+        self.blocks = deque()  # horário dos últimos erros 429
+        self.blocked_until = 0.0
 
-class CustomTrack(wavelink.Track):
+    @property
+    def blocked(self):
+        return self.blocked_until > time.time()
 
-    def __init__(self, *args, **kwargs):
-        self.requester = kwargs.pop('requester')
-        args[1]['title'] = fix_characters(args[1]['title'])
-        super().__init__(*args, **kwargs)
-        if self.ytid:
-            self.thumb = f"https://img.youtube.com/vi/{self.ytid}/mqdefault.jpg"
+    @property
+    def failure_rate(self):
+
+        if not self.results:
+            return 0.0
+
+        return self.results.count(False) / len(self.results)
+
+    def record(self, latency: Optional[float] = None, success: bool = True):
+
+        self.results.append(success)
+
+        if latency is None:
+            return
+
+        if self.rest_latency is None:
+            self.rest_latency = latency
         else:
-            self.thumb = self.info.get("artworkUrl", "")
+            self.rest_latency = self.rest_latency * 0.8 + latency * 0.2
 
+    def record_probe(self, rtt: Optional[float] = None):
 
-class CustomPlayer(wavelink.Player):
+        self.last_probe = time.time()
 
-    def __init__(self, *args, **kwargs):
-        self.ctx: commands.Context = kwargs.pop('ctx')
-        super().__init__(*args, **kwargs)
-        self.text_channel: discord.TextChannel = self.ctx.channel
-        self.message: Optional[discord.Message] = None
-        self.queue = deque()
-        self.played = deque(maxlen=20)
-        self.nightcore = False
-        self.dj = [] if self.ctx.author.guild_permissions.manage_channels else [self.ctx.author]
-        self.loop = False
-        self.last_track: Optional[CustomTrack] = None
-        self.locked = False
-        self.idle = None
-        self.idle_timeout = 180  # aguardar 3 minutos para adicionar novas músicas
-        self.is_previows_music = False
-        self.updating_message = None
-        self.command_log = ""
-        self.last_embed = None
-        self.interaction_cooldown = False
-        self.votes = set()
-        self.force_edit_message = False
-        self.restrict_mode = False
+        if rtt is None:
+            self.probe_failures += 1
+            if self.probe_failures >= node_unhealthy_after:
+                self.healthy = False
+            return
+
+        self.probe_failures = 0
+        self.probe_rtt = rtt
+        self.healthy = True
+
+    def record_block(self):
+
+        # retorna True caso o servidor tenha acabado de ser bloqueado
+        now = time.time()
+
+        self.blocks.append(now)
+
+        while self.blocks[0] < now - node_block_window:
+            self.blocks.popleft()
+
+        if len(self.blocks) < node_block_threshold:
+            return False
+
+        self.blocks.clear()
+        self.blocked_until = now + node_block_cooldown
+        return True
+
+
+def load_score(selector, node: wavelink.Node, region: Optional[str]):
+
+    score = len(node.players)
+
+    if not (stats := node.stats):
+        return score
+
+    score += stats.playing_players * 2
+    score += stats.lavalink_load * 100
+    score += stats.system_load * 50
+
+    if stats.memory_reservable:
+        score += stats.memory_used / stats.memory_reservable * 50
+
+    # penalidade do próprio lavalink por frames nulos/com déficit
+    score += stats.penalty.null_frame_penalty + stats.penalty.deficit_frame_penalty
+
+    return score
+
+
+def latency_score(selector, node: wavelink.Node, region: Optional[str]):
+    health = selector.get_health(node.identifier)
+    return (health.rest_latency or health.probe_rtt or 0) / 20 + health.failure_rate * 200
+
+
+def region_score(selector, node: wavelink.Node, region: Optional[str]):
+
+    if not region or not node.region:
+        return 0
+
+    return 0 if node.region.lower() == region else 100
+
+
+class NodeSelector:
+
+    # escolhe o servidor com a menor pontuação. novas regras podem ser adicionadas em scorers:
+    # funções (selector, node, region) -> float
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.health = {}  # identifier -> NodeHealth
+        self.drained = set()  # servidores em manutenção (não recebem novos players)
+        self.weights = {}  # identifier -> peso (a pontuação é dividida pelo peso)
+        self.scorers = [load_score, latency_score, region_score]
+
+    def get_health(self, identifier: str) -> NodeHealth:
 
-    async def destroy(self, *, force: bool = False):
         try:
-            self.idle.cancel()
-        except:
-            pass
+            return self.health[identifier]
+        except KeyError:
+            health = self.health[identifier] = NodeHealth()
+            return health
 
-        await self.destroy_message()
+    def is_usable(self, node: wavelink.Node):
 
-        await super().destroy()
+        if not node.is_available or node.identifier in self.drained:
+            return False
 
-    async def idling_mode(self):
+        health = self.health.get(node.identifier)
 
-        await self.destroy_message()
+        if not health:
+            return True
 
-        self.view = PlayerInteractions(self.ctx)
+        if health.blocked:
+            return False
 
-        self.view.add_item(discord.ui.Button(emoji="⏮️", custom_id=f"musicplayer_back", label="Voltar"))
-        self.view.add_item(discord.ui.Button(emoji="⏹️", custom_id=f"musicplayer_stop", label="Parar"))
+        # servidores que nunca foram verificados (ex: conectados manualmente) são considerados saudáveis
+        return health.last_probe is None or health.healthy
 
-        embed = discord.Embed(
-            description=f"**Não há músicas na fila. Adicione uma música ou use um dos botões abaixo\n\n"
-                        f"[O Player será desligado em: {time_format(self.idle_timeout * 1000)}]**",
-            color=self.ctx.me.colour
-        )
-        self.message = await self.text_channel.send(embed=embed, view=self.view)
+    def score(self, node: wavelink.Node, region: Optional[str] = None):
+        return sum(scorer(self, node, region) for scorer in self.scorers) / self.weights.get(node.identifier, 1)
 
-        await asyncio.sleep(self.idle_timeout)
-        embed = discord.Embed(description="**O player foi desligado por inatividade...**",
-                              color=discord.Colour.dark_gold())
-        self.bot.loop.create_task(self.text_channel.send(embed=embed))
-        self.bot.loop.create_task(self.destroy())
-        return
+    def best_node(self, region: Optional[str] = None, exclude=()) -> Optional[wavelink.Node]:
 
-    async def process_next(self):
+        nodes = [n for n in self.bot.music.nodes.values() if self.is_usable(n) and n.identifier not in exclude]
 
-        if self.locked:
+        if not nodes:
             return
 
-        try:
-            track = self.queue.popleft()
-        except:
-            self.idle = self.bot.loop.create_task(self.idling_mode())
+        region = region.replace("-", "_").lower() if region else None
+
+        return min(nodes, key=lambda n: self.score(n, region))
+
+    async def get_tracks(self, query: str):
+
+        node = self.best_node()
+
+        if not node:
             return
 
+        health = self.get_health(node.identifier)
+        start = time.perf_counter()
+
         try:
-            self.idle.cancel()
-        except:
-            pass
+            tracks = await node.get_tracks(query)
+        except Exception:
+            health.record(success=False)
+            raise
 
-        self.locked = True
+        health.record((time.perf_counter() - start) * 1000)
 
-        self.last_track = track
+        return tracks
 
-        await self.play(track)
 
-        self.locked = False
+class NodeManager:
 
-    async def invoke_np(self, force=False, interaction=None):
+    # mantém a conexão com os servidores de música durante todo o tempo de vida do bot:
+    # reconecta com backoff exponencial (com jitter) e verifica periodicamente os servidores conectados.
 
-        if not self.current:
-            return
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.tasks = {}  # identifier -> task
+        self.servers = {}  # identifier -> configuração atual do servidor
+        self.retiring = {}  # identifier -> task (servidores sendo desconectados)
 
-        embed = discord.Embed(color=self.ctx.me.color)
-        embed_top = discord.Embed(
-            color=self.ctx.me.color,
-            description=f"> [**{self.current.title}**]({self.current.uri})"
-        )
+    def apply(self, servers: list):
 
-        if not self.paused:
-            embed_top.set_author(
-                name="Tocando Agora:",
-                icon_url="https://cdn.discordapp.com/attachments/480195401543188483/895862881105616947/music_equalizer.gif"
-            )
-        else:
-            embed_top.set_author(
-                name="Em Pausa:",
-                icon_url="https://cdn.discordapp.com/attachments/480195401543188483/896013933197013002/pause.png"
+        # aplica uma nova lista de servidores: conecta os novos, desconecta os removidos (após mover os players)
+        # e reconecta os servidores que tiveram os dados de conexão alterados.
+        servers = {s['identifier']: dict(s) for s in servers}
+
+        for identifier in list(self.servers):
+            if identifier not in servers:
+                del self.servers[identifier]
+                self.bot.node_selector.weights.pop(identifier, None)
+                self.retire(identifier)
+
+        for identifier, data in servers.items():
+
+            self.bot.node_selector.weights[identifier] = data.pop('weight', 1) or 1
+
+            old = self.servers.get(identifier)
+
+            if old == data:
+                continue
+
+            self.servers[identifier] = data
+
+            if old or identifier in self.retiring:
+                # o servidor será conectado novamente com os novos dados após ser desconectado
+                self.retire(identifier)
+            else:
+                self.start(dict(data))
+
+    def load_file(self, path: str):
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                servers = json.load(f)
+        except FileNotFoundError:
+            servers = lavalink_servers
+        except Exception:
+            print(f"Falha ao ler o arquivo de servidores [{path}]:")
+            traceback.print_exc()
+            return
+
+        # uma configuração inválida mantém os servidores atuais
+        try:
+            self.check_servers(servers)
+            self.apply(servers)
+        except Exception:
+            print(f"Lista de servidores inválida em [{path}] (os servidores atuais foram mantidos):")
+            traceback.print_exc()
+
+    def check_servers(self, servers):
+
+        if not isinstance(servers, list):
+            raise ValueError("a lista de servidores deve ser uma lista (array) de servidores")
+
+        identifiers = set()
+
+        for server in servers:
+
+            if not isinstance(server, dict):
+                raise ValueError(f"servidor inválido: {server!r}")
+
+            if missing := [k for k in ('identifier', 'host', 'port', 'password', 'region') if k not in server]:
+                raise ValueError(f"servidor sem os campos {missing}: {server.get('identifier', server)!r}")
+
+            if server['identifier'] in identifiers:
+                raise ValueError(f"identifier repetido: {server['identifier']!r}")
+
+            identifiers.add(server['identifier'])
+
+    async def watch_file(self, path: str):
+
+        mtime = -1
+
+        while not self.bot.is_closed():
+
+            try:
+                current = os.path.getmtime(path)
+            except OSError:
+                current = None
+
+            if current != mtime:
+                mtime = current
+                try:
+                    self.load_file(path)
+                except Exception:
+                    traceback.print_exc()
+
+            await asyncio.sleep(lavalink_file_interval)
+
+    def retire(self, identifier: str):
+
+        self.stop(identifier)
+
+        if identifier not in self.retiring:
+            self.retiring[identifier] = self.bot.loop.create_task(self.drain_node(identifier))
+
+    async def drain_node(self, identifier: str):
+
+        try:
+            if node := self.bot.music.get_node(identifier):
+
+                # o watch_nodes se encarrega de mover os players de servidores em manutenção
+                self.bot.node_selector.drained.add(identifier)
+
+                deadline = time.monotonic() + node_drain_timeout
+
+                while node.players and not self.bot.is_closed() and time.monotonic() < deadline:
+                    await asyncio.sleep(node_check_interval)
+
+                # não há outro servidor para receber os players restantes (ex: apenas um servidor configurado)
+                for player in list(node.players.values()):
+                    try:
+                        await self.finish_player(player)
+                    except Exception:
+                        traceback.print_exc()
+
+                await node.destroy()
+
+                try:
+                    await node._websocket._websocket.close()
+                except Exception:
+                    pass
+
+                print(f"Servidor [{identifier}] desconectado.")
+
+        except Exception:
+            traceback.print_exc()
+
+        finally:
+            self.bot.node_selector.drained.discard(identifier)
+            del self.retiring[identifier]
+
+        if data := self.servers.get(identifier):
+            self.start(dict(data))
+
+    async def finish_player(self, player):
+
+        embed = discord.Embed(description="**O servidor de música foi desconectado e não há outro servidor disponível "
+                                          "no momento. O player foi finalizado...**",
+                              color=discord.Colour.dark_gold())
+
+        try:
+            await player.text_channel.send(embed=embed)
+        except Exception:
+            pass
+
+        await player.destroy()
+
+    def start(self, data: dict):
+
+        data['rest_uri'] = ("https" if data.get('secure') else "http") + f"://{data['host']}:{data['port']}"
+
+        if task := self.tasks.get(data['identifier']):
+            task.cancel()
+
+        self.tasks[data['identifier']] = self.bot.loop.create_task(self.run(data))
+
+    def stop(self, identifier: str):
+
+        try:
+            self.tasks.pop(identifier).cancel()
+        except KeyError:
+            pass
+
+    async def probe(self, data: dict):
+
+        start = time.perf_counter()
+
+        try:
+            async with self.bot.session.get(f"{data['rest_uri']}/version", headers={'Authorization': data['password']},
+                                            timeout=node_probe_timeout) as r:
+                if r.status >= 500:
+                    return
+        except Exception:
+            return
+
+        return (time.perf_counter() - start) * 1000
+
+    async def run(self, data: dict):
+
+        identifier = data['identifier']
+        health = self.bot.node_selector.get_health(identifier)
+        attempt = 0
+
+        while not self.bot.is_closed():
+
+            rtt = await self.probe(data)
+            health.record_probe(rtt)
+
+            if rtt is None:
+                attempt += 1
+                delay = uniform(0, min(node_backoff_max, node_backoff_base * 2 ** attempt))
+                print(f'Falha ao conectar no servidor [{identifier}], tentativa: {attempt} '
+                      f'(nova tentativa em {delay:.0f}s)')
+                await asyncio.sleep(delay)
+                continue
+
+            attempt = 0
+
+            try:
+                await self.ensure_connected(data)
+            except Exception:
+                traceback.print_exc()
+
+            await asyncio.sleep(node_probe_interval)
+
+    async def ensure_connected(self, data: dict):
+
+        node = self.bot.music.get_node(data['identifier'])
+
+        if not node:
+            # servidor novo ou removido anteriormente (ex: voltou depois de ficar offline)
+            await self.bot.music.initiate_node(**data)
+            return
+
+        if node._websocket and not node._websocket.is_connected:
+            await node._websocket._connect()
+
+
+########################
+### Classe de testes ###
+########################
+
+class TestBot(commands.Bot):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    async def setup_bot(self):
+        await self.wait_until_ready()
+        await self.tree.sync()
+        print(f'Logado como: {self.user} [{self.user.id}]')
+
+    async def setup_hook(self):
+        await self.add_cog(Music(self))
+        self.loop.create_task(self.setup_bot())
+
+
+##################
+##### Errors #####
+##################
+
+class NoPlayer(commands.CheckFailure):
+    pass
+
+
+class NoVoice(commands.CheckFailure):
+    pass
+
+
+class DiffVoiceChannel(commands.CheckFailure):
+    pass
+
+
+class NoSource(commands.CheckFailure):
+    pass
+
+
+class NotDJorStaff(commands.CheckFailure):
+    pass
+
+
+class NotRequester(commands.CheckFailure):
+    pass
+
+
+##############################
+##### Paginator Classes ######
+##############################
+
+class QueueInteraction(discord.ui.View):
+
+    def __init__(self, player, user: discord.Member, timeout=60):
+
+        self.player = player
+        self.user = user
+        self.pages = OrderedDict()  # (versão da fila, página) -> texto (apenas as últimas páginas vistas)
+        self.max_cached_pages = 4
+        self.current = 0
+        self.max_page = 0
+        super().__init__(timeout=timeout)
+        self.embed = discord.Embed(color=user.guild.me.colour)
+        self.update_pages()
+        self.update_embed()
+
+    def update_pages(self):
+
+        self.pages.clear()
+        self.current = 0
+        self.max_page = max(len(self.player.queue) - 1, 0) // 8
+
+    def render_page(self, page: int):
+
+        key = (self.player.queue.version, page)
+
+        try:
+            self.pages.move_to_end(key)
+            return self.pages[key]
+        except KeyError:
+            pass
+
+        counter = page * 8 + 1
+
+        txt = "\n"
+        for t in self.player.queue.islice(page * 8, page * 8 + 8):
+            txt += f"`{counter})` [`{fix_characters(t.title, limit=50)}`]({t.uri})\n" \
+                   f"`[{time_format(t.duration) if not t.is_stream else '🔴 Livestream'}]`" + \
+                   f" - {t.requester_mention}\n`---------`\n"
+
+            counter += 1
+
+        self.pages[key] = txt
+
+        while len(self.pages) > self.max_cached_pages:
+            self.pages.popitem(last=False)
+
+        return txt
+
+    def update_embed(self):
+
+        # a fila pode ter diminuído desde que as páginas foram calculadas
+        self.max_page = max(len(self.player.queue) - 1, 0) // 8
+        self.current = min(self.current, self.max_page)
+
+        self.embed.title = f"**Músicas na fila [{self.current + 1} / {self.max_page + 1}]**"
+        self.embed.description = self.render_page(self.current)
+
+    @discord.ui.button(emoji='⏮️', style=discord.ButtonStyle.grey)
+    async def first(self, interaction: discord.Interaction, button):
+
+        self.current = 0
+        self.update_embed()
+        await interaction.response.edit_message(embed=self.embed)
+
+    @discord.ui.button(emoji='⬅️', style=discord.ButtonStyle.grey)
+    async def back(self, interaction: discord.Interaction, button):
+
+        if self.current == 0:
+            self.current = self.max_page
+        else:
+            self.current -= 1
+        self.update_embed()
+        await interaction.response.edit_message(embed=self.embed)
+
+    @discord.ui.button(emoji='➡️', style=discord.ButtonStyle.grey)
+    async def next(self, interaction: discord.Interaction, button):
+
+        if self.current == self.max_page:
+            self.current = 0
+        else:
+            self.current += 1
+        self.update_embed()
+        await interaction.response.edit_message(embed=self.embed)
+
+    @discord.ui.button(emoji='⏭️', style=discord.ButtonStyle.grey)
+    async def last(self, interaction: discord.Interaction, button):
+
+        self.current = self.max_page
+        self.update_embed()
+        await interaction.response.edit_message(embed=self.embed)
+
+    @discord.ui.button(emoji='⏹️', style=discord.ButtonStyle.grey)
+    async def stop_interaction(self, interaction: discord.Interaction, button):
+
+        await interaction.response.edit_message(content="Queue fechada", embed=None, view=None)
+        self.stop()
+
+    @discord.ui.button(emoji='🔄', label="Recarregar lista", style=discord.ButtonStyle.grey)
+    async def update_q(self, interaction: discord.Interaction, button):
+
+        self.update_pages()
+        self.update_embed()
+        await interaction.response.edit_message(embed=self.embed)
+
+
+##########################
+##### Fila de músicas ####
+##########################
+
+class TitleIndex:
+
+    # índice invertido dos títulos da fila: palavra -> blocos da fila que possuem a palavra.
+    # como é indexado por bloco (e não por posição) não precisa ser renumerado quando a fila muda.
+    # as músicas pendentes são indexadas por partes dos trechos pendentes: (id do trecho, parte).
+
+    def __init__(self):
+        self.tokens = {}  # palavra -> {id do bloco ou (id do trecho, parte): quantidade de músicas}
+        self.grams = {}  # trigrama -> {palavras}
+
+    def clear(self):
+        self.tokens.clear()
+        self.grams.clear()
+
+    def add(self, block: list, tracks):
+        self.add_titles(id(block), [t.search_title for t in tracks])
+
+    def remove(self, block: list, tracks):
+        self.remove_titles(id(block), [t.search_title for t in tracks])
+
+    def add_titles(self, key, titles):
+
+        for title in titles:
+            for token in set(title.split()):
+                try:
+                    blocks = self.tokens[token]
+                except KeyError:
+                    blocks = self.tokens[token] = {}
+                    for gram in trigrams(token):
+                        self.grams.setdefault(gram, set()).add(token)
+                blocks[key] = blocks.get(key, 0) + 1
+
+    def remove_titles(self, key, titles):
+
+        for title in titles:
+            for token in set(title.split()):
+
+                blocks = self.tokens[token]
+
+                if count := blocks[key] - 1:
+                    blocks[key] = count
+                    continue
+
+                del blocks[key]
+
+                if blocks:
+                    continue
+
+                del self.tokens[token]
+
+                for gram in trigrams(token):
+                    tokens = self.grams[gram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.grams[gram]
+
+    def matching_tokens(self, word: str, check):
+
+        if len(word) < 3:
+            # palavras curtas demais para trigramas: verifica o vocabulário da fila
+            candidates = self.tokens
+        else:
+            grams = [self.grams.get(g) for g in trigrams(word)]
+            if not all(grams):
+                return []
+            candidates = set.intersection(*sorted(grams, key=len))
+
+        return [t for t in candidates if check(t)]
+
+    def blocks_of(self, tokens):
+        blocks = set()
+        for token in tokens:
+            blocks.update(self.tokens[token])
+        return blocks
+
+    def with_words(self, words: List[str]):
+
+        # blocos que possuem todas as palavras da busca
+        if not all(w in self.tokens for w in words):
+            return set()
+
+        return set.intersection(*(set(self.tokens[w]) for w in words))
+
+    def containing(self, words: List[str]):
+
+        # blocos onde a busca pode aparecer como trecho do título: as palavras do meio precisam existir
+        # inteiras, a primeira precisa terminar uma palavra do título e a última precisa iniciar uma.
+        if len(words) == 1:
+            parts = [self.matching_tokens(words[0], lambda t: words[0] in t)]
+        else:
+            parts = [
+                self.matching_tokens(words[0], lambda t: t.endswith(words[0])),
+                *([w] if w in self.tokens else [] for w in words[1:-1]),
+                self.matching_tokens(words[-1], lambda t: t.startswith(words[-1]))
+            ]
+
+        if not all(parts):
+            return set()
+
+        return set.intersection(*(self.blocks_of(p) for p in parts))
+
+
+class TrackQueue:
+
+    # fila dividida em blocos (listas) com uma árvore de fenwick sobre o tamanho dos blocos:
+    # acesso/inserção/remoção por posição em O(log n) e popleft/append em O(1) amortizado.
+    # o final da fila pode ficar pendente (entradas cruas do lavalink) e só vira música quando for alcançado.
+
+    load = 256  # tamanho base de cada bloco
+
+    def __init__(self, iterable=(), factory=None):
+        self._blocks: List[list] = []
+        self._tree = [0]
+        self._head = 0  # itens já removidos (popleft) do início do primeiro bloco
+        self._len = 0  # quantidade de músicas já materializadas (nos blocos)
+        # trechos pendentes: [requester (None = músicas prontas), entradas, início, títulos (para a busca)]
+        self._pending = deque()
+        self._pending_len = 0
+        self.factory = factory  # cria a música a partir de (id, info, requester=...)
+        self.titles = TitleIndex()
+        self.version = 0  # incrementado a cada alteração da fila
+        self.extend(iterable)
+
+    def __len__(self):
+        return self._len + self._pending_len
+
+    def __bool__(self):
+        return self._len + self._pending_len > 0
+
+    def __iter__(self):
+        self._materialize(len(self))
+        return self._materialized()
+
+    def __reversed__(self):
+
+        self._materialize(len(self))
+
+        for block in reversed(self._blocks[1:]):
+            yield from reversed(block)
+
+        if self._blocks:
+            yield from reversed(self._blocks[0][self._head:])
+
+    def __repr__(self):
+        return f"TrackQueue({list(self)!r})"
+
+    def __getitem__(self, index):
+
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return list(self.islice(start, stop))
+            return list(self)[index]
+
+        index = self._check_index(index)
+        self._materialize(index + 1)
+        b, offset = self._locate(index)
+        return self._blocks[b][offset]
+
+    def __setitem__(self, index, value):
+        index = self._check_index(index)
+        self._materialize(index + 1)
+        b, offset = self._locate(index)
+        block = self._blocks[b]
+        self.titles.remove(block, [block[offset]])
+        block[offset] = value
+        self.titles.add(block, [value])
+        self.version += 1
+
+    def __delitem__(self, index):
+        self.pop(index)
+
+    def _check_index(self, index: int):
+
+        size = len(self)
+
+        if index < 0:
+            index += size
+
+        if not 0 <= index < size:
+            raise IndexError("queue index out of range")
+
+        return index
+
+    def _materialized(self):
+
+        if not self._blocks:
+            return iter(())
+
+        return itertools.chain(itertools.islice(self._blocks[0], self._head, None), *self._blocks[1:])
+
+    def snapshot(self):
+
+        # [id, id de quem pediu] de todas as músicas da fila (sem criar as músicas pendentes)
+        entries = [[t.id, t.requester_id] for t in self._materialized()]
+
+        for requester, items, start, titles in self._pending:
+            if requester is None:
+                entries.extend([t.id, t.requester_id] for t in itertools.islice(items, start, None))
+            else:
+                entries.extend([e[0], requester.id] for e in itertools.islice(items, start, None))
+
+        return entries
+
+    def _iter_lazy(self):
+
+        # percorre a fila materializando as músicas pendentes apenas conforme forem alcançadas
+        index = 0
+
+        while index < len(self):
+            yield from self.islice(index, index + self.load)
+            index += self.load
+
+    def _materialize(self, count: int):
+
+        # cria as músicas pendentes (em lotes) até que existam pelo menos count músicas nos blocos
+        if self._len >= count or not self._pending:
+            return
+
+        needed = max(count - self._len, self.load)
+        items = []
+
+        while needed > 0 and self._pending:
+
+            segment = self._pending[0]
+            requester, entries, start, titles = segment
+            chunk = entries[start:start + needed]
+
+            # as músicas passam a ser indexadas pelos blocos
+            self._index_pending(segment, start, start + len(chunk), remove=True)
+
+            if requester is not None:
+                chunk = [self.factory(*e, requester=requester) for e in chunk]
+
+            items.extend(chunk)
+            needed -= len(chunk)
+
+            if start + len(chunk) >= len(entries):
+                self._pending.popleft()
+            else:
+                segment[2] = start + len(chunk)
+
+        self._pending_len -= len(items)
+        self._extend(items)
+
+    def _add_pending(self, tracks: list):
+
+        # músicas adicionadas depois de um trecho pendente precisam continuar depois dele
+        titles = [t.search_title for t in tracks]
+
+        if self._pending and self._pending[-1][0] is None:
+            segment = self._pending[-1]
+            first = len(segment[1])
+            segment[1].extend(tracks)
+            segment[3].extend(titles)
+        else:
+            segment = [None, tracks, 0, titles]
+            first = 0
+            self._pending.append(segment)
+
+        self._index_pending(segment, first, len(segment[1]))
+        self._pending_len += len(tracks)
+
+    def _index_pending(self, segment: list, first: int, last: int, remove=False):
+
+        # adiciona/remove do índice os títulos das entradas [first, last) do trecho pendente (em partes do mesmo
+        # tamanho dos blocos, para que a busca percorra apenas as partes com resultados)
+        titles = segment[3]
+
+        for part in range(first // self.load, -(-last // self.load)):
+            chunk = titles[max(first, part * self.load):min(last, (part + 1) * self.load)]
+            if remove:
+                self.titles.remove_titles((id(segment), part), chunk)
+            else:
+                self.titles.add_titles((id(segment), part), chunk)
+
+    def _rebuild(self):
+
+        tree = [0]
+        tree.extend(len(b) for b in self._blocks)
+        size = len(tree)
+
+        for i in range(1, size):
+            j = i + (i & -i)
+            if j < size:
+                tree[j] += tree[i]
+
+        self._tree = tree
+
+    def _update(self, b: int, delta: int):
+
+        tree = self._tree
+        size = len(tree)
+        i = b + 1
+
+        while i < size:
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, b: int):
+
+        tree = self._tree
+        total = 0
+
+        while b:
+            total += tree[b]
+            b &= b - 1
+
+        return total
+
+    def _locate(self, index: int):
+
+        # retorna (bloco, posição dentro do bloco) de um índice já validado e materializado
+        index += self._head
+        tree = self._tree
+        size = len(tree)
+        b = 0
+        step = 1 << (size.bit_length() - 1)
+
+        while step:
+            nxt = b + step
+            if nxt < size and tree[nxt] <= index:
+                b = nxt
+                index -= tree[nxt]
+            step >>= 1
+
+        return b, index
+
+    def _compact(self):
+
+        if not self._head:
+            return
+
+        del self._blocks[0][:self._head]
+        self._update(0, -self._head)
+        self._head = 0
+
+    def _split(self, b: int):
+
+        if b == 0:
+            self._compact()
+
+        block = self._blocks[b]
+        half = len(block) >> 1
+        self._move(block, half, b + 1)
+        self._rebuild()
+
+    def _split_at(self, index: int):
+
+        # garante que um bloco comece exatamente na posição informada e retorna o número desse bloco
+        self._compact()
+
+        if index >= self._len:
+            return len(self._blocks)
+
+        b, offset = self._locate(index)
+
+        if offset:
+            self._move(self._blocks[b], offset, b + 1)
+            self._rebuild()
+            b += 1
+
+        return b
+
+    def _move(self, block: list, offset: int, b: int):
+
+        # move os itens a partir de offset para um novo bloco na posição b
+        new_block = block[offset:]
+        del block[offset:]
+        self.titles.remove(block, new_block)
+        self._blocks.insert(b, new_block)
+        self.titles.add(new_block, new_block)
+
+    def _balance(self):
+
+        # reagrupa a fila caso tenha ficado fragmentada em muitos blocos pequenos
+        if len(self._blocks) > self._len // self.load * 2 + 2:
+            items = list(self._materialized())
+            # apenas os blocos são reindexados (os trechos pendentes continuam no índice)
+            for b, block in enumerate(self._blocks):
+                self.titles.remove(block, block[self._head:] if b == 0 else block)
+            self._blocks = []
+            self._head = 0
+            self._len = 0
+            self._extend(items)
+
+    def islice(self, start: int = 0, stop: Optional[int] = None):
+
+        if stop is None or stop > len(self):
+            stop = len(self)
+
+        start = max(start, 0)
+
+        if start >= stop:
+            return
+
+        self._materialize(stop)
+
+        b, offset = self._locate(start)
+        remaining = stop - start
+
+        for block in itertools.islice(self._blocks, b, None):
+            chunk = block[offset:offset + remaining]
+            yield from chunk
+            remaining -= len(chunk)
+            if not remaining:
+                return
+            offset = 0
+
+    def find(self, query: str):
+
+        # posição da primeira música cujo título contém a busca ou todas as palavras da busca
+        query = query.lower()
+        words = query.split()
+
+        if not words:
+            return 0 if len(self) else None
+
+        keys = self.titles.with_words(words) | self.titles.containing(words)
+
+        for index, track in self._scan(keys):
+            title = track.search_title
+            if query in title or all(w in title.split() for w in words):
+                return index
+
+        # as músicas pendentes são verificadas pelos títulos indexados (sem criar as músicas)
+        for index, title, entry, requester in self._scan_pending(keys):
+            if query in title or all(w in title.split() for w in words):
+                return index
+
+    def search(self, query: str, limit: int = 20):
+
+        # primeiras músicas (na ordem da fila) que contém a busca no título
+        query = query.lower()
+        words = query.split()
+
+        if not words:
+            return list(itertools.islice((t for t in self._iter_lazy() if query in t.search_title), limit))
+
+        results = []
+        keys = self.titles.containing(words)
+
+        for index, track in self._scan(keys):
+            if query in track.search_title:
+                results.append(track)
+                if len(results) >= limit:
+                    return results
+
+        for index, title, entry, requester in self._scan_pending(keys):
+            if query in title:
+                # apenas as músicas encontradas são criadas (e não são adicionadas aos blocos da fila)
+                results.append(entry if requester is None else self.factory(*entry, requester=requester))
+                if len(results) >= limit:
+                    break
+
+        return results
+
+    def _scan_pending(self, keys: set):
+
+        # percorre (na ordem da fila) apenas as partes informadas dos trechos pendentes retornando
+        # (posição, título, entrada, requester)
+        parts = {}
+
+        for key in keys:
+            if isinstance(key, tuple):
+                parts.setdefault(key[0], []).append(key[1])
+
+        if not parts:
+            return
+
+        index = self._len
+
+        for segment in self._pending:
+
+            requester, entries, start, titles = segment
+
+            for part in sorted(parts.get(id(segment), ())):
+                for i in range(max(start, part * self.load), min(len(entries), (part + 1) * self.load)):
+                    yield index + i - start, titles[i], entries[i], requester
+
+            index += len(entries) - start
+
+    def _scan(self, keys: set):
+
+        # percorre (na ordem da fila) apenas os blocos informados retornando (posição, música)
+        if not keys:
+            return
+
+        positions = {id(block): b for b, block in enumerate(self._blocks)}
+
+        for b in sorted(positions[k] for k in keys if k in positions):
+
+            block = self._blocks[b]
+            start = self._head if b == 0 else 0
+            index = self._prefix(b) - self._head
+
+            for offset in range(start, len(block)):
+                yield index + offset, block[offset]
+
+    def append(self, track):
+
+        if self._pending:
+            self._add_pending([track])
+        else:
+            self._append(track)
+
+        self.version += 1
+
+    def _append(self, track):
+
+        if self._blocks and len(self._blocks[-1]) < self.load:
+            self._blocks[-1].append(track)
+            self._update(len(self._blocks) - 1, 1)
+        else:
+            self._blocks.append([track])
+            self._rebuild()
+
+        self.titles.add(self._blocks[-1], [track])
+        self._len += 1
+
+    def appendleft(self, track):
+
+        if self._head:
+            self._head -= 1
+            self._blocks[0][self._head] = track
+        elif self._blocks and len(self._blocks[0]) < self.load:
+            self._blocks[0].insert(0, track)
+            self._update(0, 1)
+        else:
+            self._blocks.insert(0, [track])
+            self._rebuild()
+
+        self.titles.add(self._blocks[0], [track])
+        self._len += 1
+        self.version += 1
+
+    def extend(self, iterable):
+
+        items = list(iterable)
+
+        if not items:
+            return
+
+        if self._pending:
+            self._add_pending(items)
+        else:
+            self._extend(items)
+
+        self.version += 1
+
+    def extend_lazy(self, entries: list, requester):
+
+        # adiciona entradas cruas (id, info) no final da fila sem criar as músicas agora
+        if not entries:
+            return
+
+        # os títulos são normalizados uma única vez (mesmo título do CustomTrack.search_title)
+        segment = [requester, entries, 0, [sys.intern(fix_characters(e[1]['title']).lower()) for e in entries]]
+        self._pending.append(segment)
+        self._index_pending(segment, 0, len(entries))
+        self._pending_len += len(entries)
+        self.version += 1
+
+    def _extend(self, items: list):
+
+        if not items:
+            return
+
+        self._len += len(items)
+
+        if self._blocks and (free := self.load - len(self._blocks[-1])) > 0:
+            self._blocks[-1].extend(items[:free])
+            self.titles.add(self._blocks[-1], items[:free])
+            items = items[free:]
+
+        self._add_blocks(len(self._blocks), items)
+        self._rebuild()
+
+    def _add_blocks(self, b: int, items: list):
+
+        blocks = [items[i:i + self.load] for i in range(0, len(items), self.load)]
+
+        for block in blocks:
+            self.titles.add(block, block)
+
+        self._blocks[b:b] = blocks
+
+    def insert(self, index: int, track):
+
+        size = len(self)
+
+        if index < 0:
+            index += size
+
+        if index <= 0:
+            self.appendleft(track)
+            return
+
+        if index >= size:
+            self.append(track)
+            return
+
+        self._materialize(index)
+
+        self.version += 1
+
+        if index >= self._len:
+            self._append(track)
+            return
+
+        b, offset = self._locate(index)
+        block = self._blocks[b]
+        block.insert(offset, track)
+        self.titles.add(block, [track])
+        self._len += 1
+
+        if len(block) > self.load * 2:
+            self._split(b)
+        else:
+            self._update(b, 1)
+
+    def splice(self, index: int, tracks):
+
+        # insere todas as músicas a partir da posição informada de uma só vez (mantendo a ordem)
+        items = list(tracks)
+
+        if not items:
+            return
+
+        size = len(self)
+
+        if index < 0:
+            index = max(index + size, 0)
+
+        if index >= size:
+            self.extend(items)
+            return
+
+        self._materialize(index)
+
+        self.version += 1
+
+        if index >= self._len:
+            self._extend(items)
+            return
+
+        b = self._split_at(index)
+        self._add_blocks(b, items)
+        self._len += len(items)
+        self._rebuild()
+        self._balance()
+
+    def popleft(self):
+
+        self._materialize(1)
+
+        if not self._len:
+            raise IndexError("pop from an empty queue")
+
+        block = self._blocks[0]
+        track = block[self._head]
+        self.titles.remove(block, [track])
+        block[self._head] = None
+        self._head += 1
+        self._len -= 1
+        self.version += 1
+
+        if self._head == len(block):
+            del self._blocks[0]
+            self._head = 0
+            self._rebuild()
+
+        return track
+
+    def pop(self, index: int = -1):
+
+        if not len(self):
+            raise IndexError("pop from an empty queue")
+
+        index = self._check_index(index)
+
+        if index == 0:
+            return self.popleft()
+
+        self._materialize(index + 1)
+
+        b, offset = self._locate(index)
+        block = self._blocks[b]
+        track = block.pop(offset)
+        self.titles.remove(block, [track])
+        self._len -= 1
+        self.version += 1
+
+        if block:
+            self._update(b, -1)
+        else:
+            del self._blocks[b]
+            self._rebuild()
+
+        return track
+
+    def index(self, track):
+
+        for index, t in enumerate(self):
+            if t is track or t == track:
+                return index
+
+        raise ValueError("TrackQueue.index(x): x not in queue")
+
+    def remove(self, track):
+
+        try:
+            index = self.index(track)
+        except ValueError:
+            raise ValueError("TrackQueue.remove(x): x not in queue")
+
+        self.pop(index)
+
+    def rotate(self, n: int = 1):
+
+        size = len(self)
+
+        if size < 2:
+            return
+
+        n %= size
+
+        if not n:
+            return
+
+        self.version += 1
+
+        if self._pending and size - n <= self._len:
+            # as músicas do início vão para o final da fila (depois das pendentes) sem materializar o resto
+            b = self._split_at(size - n)
+            moved = list(itertools.chain.from_iterable(self._blocks[:b]))
+            for block in self._blocks[:b]:
+                self.titles.remove(block, block)
+            del self._blocks[:b]
+            self._len -= len(moved)
+            self._rebuild()
+            self._add_pending(moved)
+            return
+
+        self._materialize(size)
+
+        b = self._split_at(self._len - n)
+        self._blocks = self._blocks[b:] + self._blocks[:b]
+        self._rebuild()
+        self._balance()
+
+    def shuffle(self):
+        items = list(self)
+        shuffle(items)
+        self.clear()
+        self.extend(items)
+
+    def clear(self):
+        self._blocks = []
+        self._tree = [0]
+        self._head = 0
+        self._len = 0
+        self._pending.clear()
+        self._pending_len = 0
+        self.titles.clear()
+        self.version += 1
+
+
+##########################
+######### Timers #########
+##########################
+
+class Timer:
+
+    __slots__ = ('wheel', 'expires', 'callback', 'args', 'bucket')
+
+    def __init__(self, wheel, expires: int, callback, args):
+        self.wheel = wheel
+        self.expires = expires  # tick em que o timer expira
+        self.callback = callback
+        self.args = args
+        self.bucket: Optional[dict] = None
+
+    @property
+    def active(self):
+        return self.bucket is not None
+
+    def cancel(self):
+
+        if self.bucket is None:
+            return
+
+        del self.bucket[self]
+        self.bucket = None
+        self.wheel.count -= 1
+
+
+class TestClock:
+
+    # relógio controlado manualmente para testar os timers sem aguardar o tempo real:
+    # clock = TestClock(); wheel = TimerWheel(clock=clock); clock.advance(180); wheel.advance()
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class TimerWheel:
+
+    # timer wheel hierárquico compartilhado por todos os players: agendar e cancelar um timer é O(1) e uma única
+    # task avança o wheel (apenas enquanto houver timers agendados). cada nível tem "slots" posições e cada posição
+    # de um nível equivale a uma volta completa do nível anterior; os timers descem de nível conforme o prazo se
+    # aproxima até expirarem no primeiro nível.
+
+    def __init__(self, tick: float = timer_tick, slots: int = 64, levels: int = 4, clock=time.monotonic):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.clock = clock
+        self.start = clock()
+        self.current = 0  # último tick processado
+        self.wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self.count = 0
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return self.count
+
+    def now_tick(self):
+        return int((self.clock() - self.start) / self.tick)
+
+    def call_later(self, delay: float, callback, *args) -> Timer:
+
+        # callbacks assíncronos são executados em uma nova task ao expirar
+        if not self.count:
+            # nenhum timer pendente: não há ticks a processar até o momento atual
+            self.current = max(self.current, self.now_tick())
+
+        expires = max(-int(-(self.clock() - self.start + delay) // self.tick), self.current + 1)
+
+        timer = Timer(self, expires, callback, args)
+        self.add(timer)
+        self.count += 1
+
+        if not self.task:
+            try:
+                self.task = asyncio.get_running_loop().create_task(self.run())
+            except RuntimeError:
+                pass  # sem event loop (ex: TestClock), o wheel é avançado manualmente
+
+        self.wakeup.set()
+
+        return timer
+
+    def add(self, timer: Timer):
+
+        delta = timer.expires - self.current
+        level = 0
+        span = self.slots
+
+        while delta >= span and level < self.levels - 1:
+            level += 1
+            span *= self.slots
+
+        index = (timer.expires // (span // self.slots)) % self.slots
+
+        timer.bucket = self.wheels[level][index]
+        timer.bucket[timer] = None
+
+    def advance(self):
+
+        # processa todos os ticks até o horário atual, executando os timers expirados
+        target = self.now_tick()
+
+        while self.current < target and self.count:
+
+            self.current += 1
+
+            # redistribui os timers dos níveis superiores (do maior para o menor) quando o nível inferior completa
+            # uma volta
+            cascade = []
+            span = self.slots
+            level = 1
+            while level < self.levels and not self.current % span:
+                cascade.append((level, (self.current // span) % self.slots))
+                span *= self.slots
+                level += 1
+
+            for level, index in reversed(cascade):
+                bucket = self.wheels[level][index]
+                self.wheels[level][index] = {}
+                for timer in bucket:
+                    self.add(timer)
+
+            bucket = self.wheels[0][self.current % self.slots]
+            self.wheels[0][self.current % self.slots] = {}
+
+            for timer in list(bucket):
+                if timer.bucket is not bucket:
+                    continue  # cancelado por um dos timers anteriores
+                timer.bucket = None
+                self.count -= 1
+                try:
+                    result = timer.callback(*timer.args)
+                    if asyncio.iscoroutine(result):
+                        asyncio.get_running_loop().create_task(result)
+                except Exception:
+                    traceback.print_exc()
+
+        if not self.count:
+            self.current = max(self.current, target)
+
+    async def run(self):
+
+        while True:
+
+            if not self.count:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+
+            await asyncio.sleep(self.tick)
+
+            self.advance()
+
+    def close(self):
+
+        try:
+            self.task.cancel()
+        except AttributeError:
+            pass
+
+        self.task = None
+
+
+##############################
+#### Edição de mensagens #####
+##############################
+
+class EditScheduler:
+
+    # fila global das edições das mensagens dos players: várias atualizações pendentes da mesma mensagem são
+    # mescladas em uma única edição e as edições são distribuídas dentro do limite de message_edit_rate.
+    # respostas de interações são processadas antes das demais edições.
+
+    def __init__(self, bot: commands.Bot, rate: float = message_edit_rate):
+        self.bot = bot
+        self.rate = rate
+        self.tokens = rate
+        self.last_refill = time.monotonic()
+        self.pending = OrderedDict()  # guild_id -> [player, horário previsto, force]
+        self.priority = deque()  # (player, interaction)
+        self.editing = set()  # guild_id das mensagens sendo editadas
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.merged = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.pending) + len(self.priority)
+
+    def schedule(self, player, interaction: Optional[discord.Interaction] = None, force=False,
+                 delay: float = message_edit_delay):
+
+        guild_id = player.guild_id
+
+        if interaction:
+            # a edição via interação substitui a edição pendente da mesma mensagem
+            if self.pending.pop(guild_id, None):
+                self.merged += 1
+            self.priority.append((player, interaction))
+
+        elif entry := self.pending.get(guild_id):
+            self.merged += 1
+            entry[1] = min(entry[1], time.monotonic() + delay)
+            entry[2] = entry[2] or force
+
+        else:
+            self.pending[guild_id] = [player, time.monotonic() + delay, force]
+
+        self.wakeup.set()
+
+        if not self.task:
+            self.task = self.bot.loop.create_task(self.run())
+
+    def take_token(self, priority=False):
+
+        # retorna o tempo de espera caso o limite de edições tenha sido atingido
+        # (interações não aguardam, mas consomem o limite das demais edições)
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+        if self.tokens < 1 and not priority:
+            return (1 - self.tokens) / self.rate
+
+        self.tokens -= 1
+
+    async def wait(self, timeout: Optional[float] = None):
+
+        # aguarda o tempo informado ou um novo pedido de edição (ex: interação)
+        self.wakeup.clear()
+
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+
+        while not self.bot.is_closed():
+
+            if self.priority:
+                self.take_token(priority=True)
+                player, interaction = self.priority.popleft()
+                self.bot.loop.create_task(self.edit(player, interaction=interaction))
+                continue
+
+            if not self.pending:
+                await self.wait()
+                continue
+
+            # as edições pendentes estão na ordem em que foram pedidas
+            due = min(e[1] for e in itertools.islice(self.pending.values(), 50))
+
+            if (delay := due - time.monotonic()) > 0:
+                await self.wait(delay)
+                continue
+
+            if delay := self.take_token():
+                await self.wait(delay)
+                continue
+
+            for guild_id, (player, due, force) in self.pending.items():
+                if due <= time.monotonic():
+                    break
+
+            del self.pending[guild_id]
+
+            if guild_id in self.editing:
+                # aguarda a edição atual da mesma mensagem terminar
+                self.tokens += 1
+                self.pending[guild_id] = [player, time.monotonic() + 1, force]
+                continue
+
+            self.bot.loop.create_task(self.edit(player, force=force))
+
+    async def edit(self, player, interaction: Optional[discord.Interaction] = None, force=False):
+
+        guild_id = player.guild_id
+
+        if player.node.players.get(guild_id) is not player or not player.current or \
+                (not force and player.message and player.np_fingerprint() == player.message_fingerprint):
+            self.dropped += 1
+            if interaction:
+                try:
+                    await interaction.response.defer()
+                except Exception:
+                    pass
+            return
+
+        self.editing.add(guild_id)
+
+        try:
+            await player.invoke_np(force=force, interaction=interaction)
+            self.sent += 1
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.editing.discard(guild_id)
+
+    def close(self):
+
+        try:
+            self.task.cancel()
+        except AttributeError:
+            pass
+
+        self.task = None
+
+
+##########################
+##### Music Classes ######
+##########################
+
+class PlayerInteractions(discord.ui.View):
+
+    # controle -> (checagens, cooldown (usos, segundos, tipo)). os botões são tratados diretamente pelos métodos
+    # control_<controle> (sem criar o contexto da mensagem nem invocar o comando correspondente).
+    controls = {
+        "help": ((), None),
+        "playpause": (("source", "dj"), (2, 10, commands.BucketType.member)),
+        "back": (("requester",), (2, 8, commands.BucketType.guild)),
+        "skip": (("requester",), (2, 8, commands.BucketType.guild)),
+        "nightcore": (("source", "dj"), (1, 5, commands.BucketType.guild)),
+        "loop": (("source", "dj"), (3, 5, commands.BucketType.member)),
+        "stop": (("dj",), None),
+        "fastbackward": (("source", "dj"), (2, 5, commands.BucketType.member)),
+        "fastforward": (("source", "dj"), (2, 5, commands.BucketType.member)),
+        "shuffle": (("dj",), (3, 5, commands.BucketType.member)),
+    }
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+        super().__init__(timeout=None)
+
+        # view persistente única (registrada no bot) que recebe os cliques de todos os players.
+        # os botões exibidos em cada mensagem são gerados pelo get_player_view.
+        for control in self.controls:
+            self.add_item(discord.ui.Button(custom_id=f"musicplayer_{control}", label=control))
+
+    async def interaction_check(self, interaction: discord.Interaction):
+
+        player = self.bot.music.players.get(interaction.guild.id)
+
+        if not player:
+            await self.send_error(interaction, "**Não há player inicializado no servidor.**")
+            return
+
+        if player.interaction_lock.locked() or player.state == PlayerState.loading:
+            await interaction.response.send_message("O player está em cooldown, tente novamente em instantes.",
+                                                    ephemeral=True)
+            return
+
+        vc = self.bot.get_channel(player.channel_id)
+
+        if interaction.user not in vc.members:
+            await self.send_error(interaction, f"Você deve estar no canal <#{vc.id}> para usar isto.")
+            return
+
+        control = interaction.data.get("custom_id")[12:]
+
+        try:
+            checks, cooldown = self.controls[control]
+        except KeyError:
+            return
+
+        if not await self.run_checks(player, interaction, checks):
+            return
+
+        if cooldown and (retry_after := self.update_cooldown(player, interaction, control, *cooldown)):
+            await self.send_error(interaction, "**Você deve aguardar {} para usar este comando.**".format(
+                time_format(max(int(retry_after), 1) * 1000)))
+            return
+
+        # o cooldown dos botões dura apenas o tempo de execução do comando
+        async with player.interaction_lock:
+            try:
+                await getattr(self, f"control_{control}")(player, interaction)
+            except Exception as e:
+                traceback.print_exc()
+                # mesma resposta do cog_command_error (o clique não pode ficar sem resposta)
+                if not interaction.response.is_done():
+                    await self.send_error(
+                        interaction, f"**Ocorreu um erro no botão:** `{control}`\n"
+                                     f"```py\n{repr(e)[:2000].replace(self.bot.http.token, 'mytoken')}```")
+
+    async def send_error(self, interaction: discord.Interaction, txt: str):
+        await interaction.response.send_message(embed=discord.Embed(description=txt, color=discord.Colour.red()),
+                                                ephemeral=True)
+
+    async def check_perm(self, player, member: discord.Member):
+
+        # mesmas regras do has_perm
+        if member in player.dj or member.guild_permissions.manage_channels:
+            return True
+
+        vc = self.bot.get_channel(player.channel_id)
+
+        if self.bot.intents.members and not [m for m in vc.members if
+                                                 not m.bot and (m.guild_permissions.manage_channels or m in player.dj)]:
+            player.dj.append(member)
+            await player.text_channel.send(embed=discord.Embed(
+                description=f"{member.mention} foi adicionado à lista de DJ's por não haver um no canal <#{vc.id}>.",
+                color=member.guild.me.color))
+            return True
+
+        return False
+
+    async def run_checks(self, player, interaction: discord.Interaction, checks):
+
+        if ("source" in checks or "requester" in checks) and not player.current:
+            await self.send_error(interaction, "**Não há músicas no player atualmente.**")
+            return False
+
+        if "dj" in checks and player.restrict_mode and not await self.check_perm(player, interaction.user):
+            await self.send_error(interaction, "**Você deve estar na lista de DJ ou ter a permissão de **Gerenciar "
+                                               "canais** para usar este comando.**")
+            return False
+
+        if "requester" in checks and player.current.requester_id != interaction.user.id and \
+                not await self.check_perm(player, interaction.user):
+            await self.send_error(interaction, "**Você deve ser dono da música atual ou estar na lista de DJ ou ter a "
+                                               "permissão de **Gerenciar canais** para pular músicas.**")
+            return False
+
+        return True
+
+    def update_cooldown(self, player, interaction: discord.Interaction, control: str, rate: int, per: int, bucket):
+
+        if interaction.user.guild_permissions.administrator:
+            return
+
+        key = (control, interaction.user.id if bucket == commands.BucketType.member else None)
+
+        try:
+            cooldown = player.button_cooldowns[key]
+        except KeyError:
+            cooldown = player.button_cooldowns[key] = commands.Cooldown(rate, per)
+
+        return cooldown.update_rate_limit()
+
+    def log(self, player, interaction: discord.Interaction, txt: str):
+        player.command_log = f"{interaction.user.mention} {txt}"
+        player.update_message(interaction=interaction)
+
+    async def control_help(self, player, interaction: discord.Interaction):
+
+        embed = discord.Embed(
+            description=f"📘 **IFORMAÇÕES SOBRE OS BOTÕES** 📘\n\n"
+                        f"⏯️ `= Pausar/Retomar a música`\n"
+                        f"⏮️ `= Voltar para a música tocada anteriormente`\n"
+                        f"⏭️ `= Pular para a próxima música`\n"
+                        f"⏪ `= Voltar o tempo da música em 20 seg.`\n"
+                        f"⏩ `= Avançar o tempo da música em 20 seg.`\n"
+                        f"⏹️ `= Parar o player e me desconectar do canal`\n"
+                        f"🔀 `= Misturar as músicas da fila`\n"
+                        f"🇳 `= Ativar/Desativar o efeito Nightcore`\n"
+                        f"🔁 `= Ativar/Desativar repetição da música`",
+            color=interaction.guild.me.color
+        )
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    async def control_playpause(self, player, interaction: discord.Interaction):
+
+        await player.set_pause(not player.paused)
+
+        self.log(player, interaction, "pausou a música." if player.paused else "retomou a música.")
+
+    async def control_back(self, player, interaction: discord.Interaction):
+
+        if not len(player.played) and not len(player.queue):
+            await player.seek(0)
+            self.log(player, interaction, "voltou para o início da música.")
+            return
+
+        playing = await player.submit(player.previous)
+
+        await interaction.response.defer()
+        player.command_log = f"{interaction.user.mention} voltou para a música atual."
+
+        if playing:
+            await player.stop()
+
+    async def control_skip(self, player, interaction: discord.Interaction):
+
+        if not len(player.queue):
+            await self.send_error(interaction, "Não há músicas na fila...")
+            return
+
+        await interaction.response.defer()
+        player.command_log = f"{interaction.user.mention} pulou a música."
+
+        if player.loop == "current":
+            player.loop = False
+
+        await player.stop()
+
+    async def control_nightcore(self, player, interaction: discord.Interaction):
+
+        player.nightcore = not player.nightcore
+
+        await player.update_filters()
+
+        self.log(player, interaction, f"{'ativou' if player.nightcore else 'desativou'} o efeito nightcore.")
+
+    async def control_loop(self, player, interaction: discord.Interaction):
+
+        # desativado -> música atual -> fila -> desativado
+        if player.loop == "current":
+            player.loop = "queue"
+            txt = "ativou a repetição da fila."
+        elif player.loop == "queue":
+            player.loop = False
+            txt = "desativou a repetição da música."
+        else:
+            player.loop = "current"
+            txt = "ativou a repetição da música."
+
+        self.log(player, interaction, txt)
+
+    async def control_stop(self, player, interaction: discord.Interaction):
+
+        await player.destroy()
+
+        await interaction.response.send_message(
+            embed=discord.Embed(color=discord.Colour.red(), description=f"{interaction.user.mention} **parou o player!**")
+        )
+
+    async def seek(self, player, interaction: discord.Interaction, milliseconds: int):
+
+        if player.current.is_stream:
+            await self.send_error(interaction, "Você não pode usar este comando em uma livestream.")
+            return
+
+        milliseconds = max(milliseconds, 0)
+
+        txt = f"{'avançou' if milliseconds > player.position else 'voltou'} a música para: {time_format(milliseconds)}"
+
+        await player.seek(milliseconds)
+
+        self.log(player, interaction, txt)
+
+    async def control_fastbackward(self, player, interaction: discord.Interaction):
+        await self.seek(player, interaction, int(player.position) - 20000)
+
+    async def control_fastforward(self, player, interaction: discord.Interaction):
+        await self.seek(player, interaction, int(player.position) + 20000)
+
+    async def control_shuffle(self, player, interaction: discord.Interaction):
+
+        if len(player.queue) < 3:
+            await self.send_error(interaction, "A fila tem que ter no mínimo 3 músicas para ser misturada.")
+            return
+
+        await player.submit(player.queue.shuffle)
+
+        self.log(player, interaction, "misturou as músicas da fila.")
+
+
+class CustomTrack(wavelink.Track):
+
+    # versão compacta da track: não mantém o info completo do wavelink nem o objeto do membro que pediu a
+    # música (apenas o id, obtido do servidor quando necessário). textos repetidos entre tracks são internados.
+
+    __slots__ = ('requester_id', 'guild', 'search_title', 'artwork', 'checked_node')
+
+    def __init__(self, id_, info: dict, *, requester: Optional[discord.Member] = None, requester_id: int = None,
+                 guild: Optional[discord.Guild] = None):
+        self.id = id_
+        self.info = None
+        self.query = None
+        self.title = sys.intern(fix_characters(info['title']))
+        self.search_title = sys.intern(self.title.lower())
+        self.identifier = info.get('identifier', '')
+        self.ytid = self.identifier if YTID_REG.match(self.identifier) else None
+        self.length = self.duration = info.get('length')
+        self.uri = sys.intern(info['uri']) if info.get('uri') else None
+        self.author = sys.intern(info['author']) if info.get('author') else None
+        self.is_stream = info.get('isStream')
+        self.dead = False
+        self.artwork = None if self.ytid else info.get('artworkUrl')
+        # músicas restauradas recebem apenas o id de quem pediu (o membro pode não estar no cache)
+        self.requester_id = requester.id if requester else requester_id
+        self.guild = requester.guild if requester else guild
+        self.checked_node = None  # servidor onde a track foi validada pelo prefetch
+
+    @property
+    def thumb(self):
+        if self.ytid:
+            return f"https://img.youtube.com/vi/{self.ytid}/mqdefault.jpg"
+        return self.artwork or ""
+
+    @property
+    def requester(self) -> Optional[discord.Member]:
+        return self.guild.get_member(self.requester_id)
+
+    @property
+    def requester_mention(self):
+        return f"<@{self.requester_id}>"
+
+
+# views usadas apenas para exibir os botões nas mensagens do player (os cliques são recebidos pela view persistente).
+# ficam finalizadas para não serem armazenadas pelo discord.py a cada mensagem enviada/editada.
+player_views = {}
+
+
+def get_player_view(paused=False, nightcore=False, loop=False, has_queue=False, idle=False):
+
+    key = (paused, nightcore, loop, has_queue, idle)
+
+    try:
+        return player_views[key]
+    except KeyError:
+        pass
+
+    view = discord.ui.View(timeout=None)
+
+    if idle:
+        view.add_item(discord.ui.Button(emoji="⏮️", custom_id=f"musicplayer_back", label="Voltar"))
+        view.add_item(discord.ui.Button(emoji="⏹️", custom_id=f"musicplayer_stop", label="Parar"))
+
+    else:
+        view.add_item(
+            discord.ui.Button(emoji="⏯️", custom_id=f"musicplayer_playpause", style=get_button_style(paused)))
+        view.add_item(discord.ui.Button(emoji="⏮️", custom_id=f"musicplayer_back"))
+        view.add_item(discord.ui.Button(emoji="⏭️", custom_id=f"musicplayer_skip", disabled=not has_queue))
+        view.add_item(discord.ui.Button(emoji="🇳", custom_id=f"musicplayer_nightcore",
+                                        style=get_button_style(nightcore, red=False)))
+        view.add_item(discord.ui.Button(
+            emoji=("🔂" if loop == "current" else "🔁"),
+            custom_id=f"musicplayer_loop", style=discord.ButtonStyle.grey
+            if not loop else discord.ButtonStyle.blurple
+            if loop == "current"
+            else discord.ButtonStyle.green)
+        )
+        view.add_item(discord.ui.Button(emoji="⏹️", custom_id=f"musicplayer_stop"))
+        view.add_item(discord.ui.Button(emoji="⏪", custom_id=f"musicplayer_fastbackward"))
+        view.add_item(discord.ui.Button(emoji="⏩", custom_id=f"musicplayer_fastforward"))
+        view.add_item(discord.ui.Button(emoji="🔀", custom_id=f"musicplayer_shuffle"))
+        view.add_item(discord.ui.Button(emoji="ℹ️", custom_id=f"musicplayer_help"))
+
+    view.stop()
+
+    player_views[key] = view
+
+    return view
+
+
+class PlayerState:
+
+    idle = "idle"  # sem música (aguardando novas músicas)
+    loading = "loading"  # enviando a próxima música para o servidor
+    playing = "playing"
+    paused = "paused"
+    erroring = "erroring"  # falha ao reproduzir (aguardando nova tentativa)
+
+
+class CustomPlayer(wavelink.Player):
+
+    def __init__(self, *args, **kwargs):
+        # players restaurados ao iniciar o bot são criados sem ctx (apenas com o canal de texto)
+        ctx: Optional[commands.Context] = kwargs.pop('ctx', None)
+        text_channel = kwargs.pop('text_channel', None)
+        super().__init__(*args, **kwargs)
+        self.text_channel: discord.TextChannel = text_channel or ctx.channel
+        self.message: Optional[discord.Message] = None
+        self.queue = TrackQueue(factory=CustomTrack)
+        self.played = deque(maxlen=20)
+        self.nightcore = False
+        self.dj = [] if not ctx or ctx.author.guild_permissions.manage_channels else [ctx.author]
+        self.loop = False
+        self.last_track: Optional[CustomTrack] = None
+        self.state = PlayerState.idle
+        self.state_lock = asyncio.Lock()  # as transições de estado (próxima música, fim, erro) ocorrem uma por vez
+        self.retry_timer: Optional[Timer] = None
+        self.error_retries = 0
+        self.idle = None
+        self.idle_timer: Optional[Timer] = None
+        self.idle_timeout = 180  # aguardar 3 minutos para adicionar novas músicas
+        self.is_previows_music = False
+        self.mailbox = deque()  # alterações pendentes na fila: (função, args, future)
+        self.mailbox_task: Optional[asyncio.Task] = None
+        self.command_log = ""
+        self.clear_command_log = False  # limpa o command_log após exibi-lo na mensagem da nova música
+        self.last_embed = None
+        self.np_render = None  # (fingerprint, embeds, view) da última renderização da mensagem do player
+        self.message_fingerprint = None  # fingerprint do conteúdo atual da mensagem do player
+        self.interaction_lock = asyncio.Lock()
+        self.button_cooldowns = {}  # (controle, id do membro ou None) -> cooldown dos botões do player
+        self.votes = set()
+        self.force_edit_message = False
+        self.restrict_mode = False
+        self.prefetch_task: Optional[asyncio.Task] = None
+        self.track_end_time: Optional[float] = None  # usado para medir o intervalo entre as músicas
+
+    @property
+    def guild(self) -> discord.Guild:
+        return self.bot.get_guild(self.guild_id)
+
+    def snapshot(self):
+
+        # estado salvo pelo player_store (a fila é salva separadamente)
+        return {
+            "channel_id": self.channel_id,
+            "text_channel_id": self.text_channel.id,
+            "current": [self.current.id, self.current.requester_id, int(self.position)] if self.current else None,
+            "played": [[t.id, t.requester_id] for t in self.played],
+            "loop": self.loop,
+            "volume": self.volume,
+            "nightcore": self.nightcore,
+            "paused": self.paused,
+            "restrict_mode": self.restrict_mode,
+            "dj": [m.id for m in self.dj],
+        }
+
+    async def destroy(self, *, force: bool = False):
+        try:
+            self.idle.cancel()
+        except:
+            pass
+
+        if self.idle_timer:
+            self.idle_timer.cancel()
+
+        try:
+            self.prefetch_task.cancel()
+        except:
+            pass
+
+        if self.retry_timer:
+            self.retry_timer.cancel()
+
+        try:
+            self.mailbox_task.cancel()
+        except:
+            pass
+
+        self.clear_mailbox()
+
+        await self.destroy_message()
+
+        await super().destroy()
+
+    async def idling_mode(self):
+
+        await self.destroy_message()
+
+        self.view = get_player_view(idle=True)
+
+        embed = discord.Embed(
+            description=f"**Não há músicas na fila. Adicione uma música ou use um dos botões abaixo\n\n"
+                        f"[O Player será desligado em: {time_format(self.idle_timeout * 1000)}]**",
+            color=self.guild.me.colour
+        )
+        self.message = await self.text_channel.send(embed=embed, view=self.view)
+
+    def idle_expired(self):
+
+        self.idle_timer = None
+
+        embed = discord.Embed(description="**O player foi desligado por inatividade...**",
+                              color=discord.Colour.dark_gold())
+        self.bot.loop.create_task(self.text_channel.send(embed=embed))
+        self.bot.loop.create_task(self.destroy())
+
+    async def update_filters(self):
+
+        op = {"op": "filters", "guildId": str(self.guild_id)}
+
+        if self.nightcore:
+            op["timescale"] = {"pitch": 1.2, "speed": 1.1, "rate": 1.0}
+
+        await self.node._send(**op)
+
+    async def set_pause(self, pause: bool):
+
+        await super().set_pause(pause)
+
+        if self.state in (PlayerState.playing, PlayerState.paused):
+            self.state = PlayerState.paused if pause else PlayerState.playing
+
+    async def process_next(self):
+
+        async with self.state_lock:
+
+            # uma música já está sendo carregada/tocando (o fim dela inicia a próxima)
+            if self.state in (PlayerState.loading, PlayerState.playing, PlayerState.paused):
+                return
+
+            await self.play_next()
+
+    async def play_next(self, start: int = 0):
+
+        # deve ser chamado com o state_lock adquirido
+        if self.retry_timer:
+            self.retry_timer.cancel()
+
+        try:
+            track = self.queue.popleft()
+        except:
+            self.track_end_time = None
+            self.state = PlayerState.idle
+            self.idle = self.bot.loop.create_task(self.idling_mode())
+            if not self.idle_timer:
+                self.idle_timer = self.bot.timers.call_later(self.idle_timeout, self.idle_expired)
+            return
+
+        try:
+            self.idle.cancel()
+        except:
+            pass
+
+        if self.idle_timer:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+
+        self.state = PlayerState.loading
+
+        self.last_track = track
+
+        try:
+            await self.play(track, start=start)
+        except Exception:
+            traceback.print_exc()
+            self.queue.appendleft(track)
+            self.retry_later()
+            return
+
+        self.state = PlayerState.paused if self.paused else PlayerState.playing
+
+        self.prefetch_next()
+
+    def retry_later(self):
+
+        # nova tentativa com espera exponencial (ex: servidor bloqueado sem outro servidor disponível)
+        self.state = PlayerState.erroring
+        delay = min(120, 6 * 2 ** self.error_retries)
+        self.error_retries += 1
+        self.retry_timer = self.bot.timers.call_later(delay, self.retry)
+
+    async def retry(self):
+
+        async with self.state_lock:
+
+            self.retry_timer = None
+
+            if self.state == PlayerState.erroring:
+                await self.play_next()
+
+    def prefetch_next(self):
+
+        try:
+            self.prefetch_task.cancel()
+        except:
+            pass
+
+        self.prefetch_task = self.bot.loop.create_task(self.prefetch())
+
+    async def prefetch(self):
+
+        # valida a próxima música da fila enquanto a atual toca para que ela comece sem atraso no fim da atual.
+        # tracks que não são aceitas pelo servidor atual (ex: salvas há muito tempo no cache em arquivo ou obtidas
+        # em outro servidor/versão do lavalink) são buscadas novamente pelo link.
+        try:
+            track = self.queue[0]
+        except IndexError:
+            return
+
+        node = self.node
+
+        if track.checked_node == node.identifier:
+            return
+
+        try:
+            await node.build_track(track.id)
+        except wavelink.BuildTrackError:
+            if not track.uri:
+                return
+            try:
+                tracks = await node.get_tracks(track.uri)
+            except Exception:
+                return
+            if not isinstance(tracks, list) or not tracks:
+                return
+            track.id = tracks[0].id
+        except Exception:
+            return
+
+        track.checked_node = node.identifier
+
+    def np_fingerprint(self):
+
+        # tudo que é exibido na mensagem do player (as tracks são comparadas pelo objeto)
+        return (
+            self.current, self.paused, self.volume, self.loop, self.nightcore, self.restrict_mode,
+            tuple(self.queue.islice(0, 3)), len(self.queue), self.command_log, self.guild.me.color.value
+        )
+
+    def render_np(self):
+
+        fingerprint = self.np_fingerprint()
+
+        if self.np_render and self.np_render[0] == fingerprint:
+            return self.np_render
+
+        embed = discord.Embed(color=self.guild.me.color)
+        embed_top = discord.Embed(
+            color=self.guild.me.color,
+            description=f"> [**{self.current.title}**]({self.current.uri})"
+        )
+
+        if not self.paused:
+            embed_top.set_author(
+                name="Tocando Agora:",
+                icon_url="https://cdn.discordapp.com/attachments/480195401543188483/895862881105616947/music_equalizer.gif"
+            )
+        else:
+            embed_top.set_author(
+                name="Em Pausa:",
+                icon_url="https://cdn.discordapp.com/attachments/480195401543188483/896013933197013002/pause.png"
             )
         embed_top.set_thumbnail(url=self.current.thumb)
 
-        if self.current.is_stream:
-            duration = "🔴 **⠂Livestream**"
+        if self.current.is_stream:
+            duration = "🔴 **⠂Livestream**"
+        else:
+            duration = f"⏰ **⠂Duração:** `{time_format(self.current.duration)}`"
+
+        txt = f"> {duration}\n" \
+              f"> 💠 **⠂Uploader**: `{self.current.author}`\n" \
+              f"> 🎧 **⠂Pedido por:** {self.current.requester_mention}\n" \
+              f"> 🔊 **⠂Volume:** `{self.volume}%`"
+
+        txt += "\n"
+
+        if self.restrict_mode:
+            txt += "> 🔒 **⠂Modo restrito: `ativado`\n"
+
+        if self.command_log:
+            txt += f"> 📈 **⠂Última Interação:** {self.command_log}\n"
+
+        if len(self.queue):
+
+            txt += "```ansi\n[34;1mPróximas Músicas:[0m```"
+            txt += "\n".join(
+                f"`{n + 1}) [{time_format(t.duration) if t.duration else '🔴 Livestream'}]` [`{fix_characters(t.title, 31)}`]({t.uri})"
+                for n, t
+                in enumerate(self.queue.islice(0, 3))
+            )
+
+            if (qsize := len(self.queue)) > 3:
+                txt += f"\n`╚══════ E mais {qsize - 3} música(s) ══════╝`"
+
+        embed.description = txt
+
+        embed.set_image(
+            url="https://cdn.discordapp.com/attachments/554468640942981147/937918500784197632/rainbow_bar.gif"
+        )
+
+        embed_top.set_image(
+            url="https://cdn.discordapp.com/attachments/554468640942981147/937918500784197632/rainbow_bar.gif"
+        )
+
+        self.np_render = (fingerprint, [embed_top, embed],
+                          get_player_view(self.paused, self.nightcore, self.loop, bool(self.queue)))
+
+        return self.np_render
+
+    async def invoke_np(self, force=False, interaction=None):
+
+        if not self.current:
+            return
+
+        fingerprint, embeds, self.view = self.render_np()
+
+        if self.clear_command_log:
+            # a última interação (ex: pulou a música) é exibida apenas na primeira mensagem da nova música
+            self.clear_command_log = False
+            self.command_log = ""
+
+        if not force and self.message:
+
+            self.force_edit_message = False
+
+            # nada visível mudou desde a última edição: a mensagem não é editada
+            if fingerprint == self.message_fingerprint:
+                if interaction:
+                    await interaction.response.defer()
+                return
+
+            try:
+                if interaction:
+                    await interaction.response.edit_message(embeds=embeds, view=self.view)
+                else:
+                    await self.message.edit(embeds=embeds, view=self.view)
+                self.message_fingerprint = fingerprint
+                return
+            except:
+                traceback.print_exc()
+                pass
+
+        await self.destroy_message(destroy_view=False)
+
+        self.last_embed = embeds[1]
+
+        self.message = await self.text_channel.send(embeds=embeds, view=self.view)
+        self.message_fingerprint = fingerprint
+
+    async def destroy_message(self, destroy_view=True):
+
+        if destroy_view:
+            self.view = None
+
+        self.message_fingerprint = None
+
+        try:
+            await self.message.delete()
+        except:
+            pass
+
+        self.last_embed = None
+
+        self.message = None
+
+    def is_last_message(self):
+
+        try:
+            return self.text_channel.last_message_id == self.message.id
+        except AttributeError:
+            return
+
+    def update_message(self, interaction=None):
+        self.bot.edit_scheduler.schedule(self, interaction=interaction)
+
+    def previous(self):
+
+        # volta para a música anterior (deve ser usado através do submit).
+        # retorna se havia música tocando (que deve ser parada para iniciar a anterior).
+        playing = bool(self.current)
+
+        try:
+            track = self.played.pop()
+        except:
+            track = self.queue.pop()
+            self.last_track = None
+            self.queue.appendleft(self.current)
+        self.queue.appendleft(track)
+
+        if self.loop == "current":
+            self.loop = False
+        self.is_previows_music = True
+
+        return playing
+
+    def submit(self, func, *args):
+
+        # as alterações na fila são aplicadas em ordem por uma única task. alterações enviadas juntas (ex: vários
+        # membros usando o comando play ao mesmo tempo) são aplicadas em lote com uma única atualização do player.
+        future = self.bot.loop.create_future()
+        self.mailbox.append((func, args, future))
+
+        if not self.mailbox_task:
+            self.mailbox_task = self.bot.loop.create_task(self.process_mailbox())
+
+        return future
+
+    async def process_mailbox(self):
+
+        try:
+
+            while self.mailbox:
+
+                await asyncio.sleep(0)  # aguarda as alterações enviadas no mesmo ciclo
+
+                batch = list(self.mailbox)
+                self.mailbox.clear()
+
+                for func, args, future in batch:
+                    # a alteração é aplicada mesmo se quem enviou não estiver mais aguardando (cancelado)
+                    try:
+                        result = func(*args)
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                    else:
+                        if not future.done():
+                            future.set_result(result)
+
+                try:
+                    if not self.current and self.queue:
+                        await self.process_next()
+                    else:
+                        self.update_message()
+                except Exception:
+                    traceback.print_exc()
+
+        except asyncio.CancelledError:
+            self.clear_mailbox()
+            raise
+
+        finally:
+            self.mailbox_task = None
+
+    def clear_mailbox(self):
+
+        # alterações que não serão mais aplicadas (player finalizado): quem estiver aguardando é cancelado
+        while self.mailbox:
+            func, args, future = self.mailbox.popleft()
+            if not future.done():
+                future.cancel()
+
+
+##################################
+##### Music Commands/Events ######
+##################################
+
+class Music(commands.Cog, wavelink.WavelinkMixin):
+
+    def __init__(self, bot: commands.Bot):
+
+        if not hasattr(bot, 'music'):
+            bot.music = wavelink.Client(bot=bot)
+
+        if not hasattr(bot, 'track_cache'):
+            bot.track_cache = TrackCache(max_size=search_cache_size, ttl=search_cache_ttl)
+
+        if not hasattr(bot, 'track_lookups'):
+            bot.track_lookups = {}
+
+        if not hasattr(bot, 'track_gaps'):
+            bot.track_gaps = deque(maxlen=200)  # intervalo (ms) entre o fim de uma música e o início da próxima
+
+        if not hasattr(bot, 'node_selector'):
+            bot.node_selector = NodeSelector(bot)
+
+        if not hasattr(bot, 'player_view'):
+            bot.player_view = PlayerInteractions(bot)
+            bot.add_view(bot.player_view)
+
+        if not hasattr(bot, 'timers'):
+            bot.timers = TimerWheel()
+
+        if not hasattr(bot, 'edit_scheduler'):
+            bot.edit_scheduler = EditScheduler(bot)
+
+        if not hasattr(bot, 'node_manager'):
+            bot.node_manager = NodeManager(bot)
+
+        if not hasattr(bot, 'track_store'):
+            bot.track_store = TrackStore(track_store_file, max_size=track_store_max_size,
+                                         ttl=track_store_ttl) if track_store_file else None
+
+        if not hasattr(bot, 'decode_semaphore'):
+            bot.decode_semaphore = asyncio.Semaphore(decode_concurrency)
+
+        if not hasattr(bot, 'player_store'):
+            bot.player_store = PlayerStore(player_store_file, max_age=player_store_max_age) if player_store_file else None
+
+        self.bot = bot
+        self.store_tasks: List[asyncio.Task] = []  # restauração e salvamento dos players
+        # servidores indisponíveis sem outro servidor para receber os players: identifier -> [próxima tentativa, espera]
+        self.stranded = {}
+
+        self.bot.loop.create_task(self.process_nodes())
+
+    async def cog_load(self):
+
+        # iniciado pelo próprio cog para funcionar tanto pelo setup_hook quanto pelo load_extension
+        if self.bot.player_store:
+            self.store_tasks = [self.bot.loop.create_task(self.restore_players()),
+                                self.bot.loop.create_task(self.save_players())]
+
+    async def process_nodes(self):
+
+        await self.bot.wait_until_ready()
+
+        if not hasattr(self.bot, 'session') or not self.bot.session:
+            self.bot.session = ClientSession()
+
+        if lavalink_file:
+            self.bot.loop.create_task(self.bot.node_manager.watch_file(lavalink_file))
+        else:
+            self.bot.node_manager.apply(lavalink_servers)
+
+        self.bot.loop.create_task(self.watch_nodes())
+
+    async def watch_nodes(self):
+
+        while not self.bot.is_closed():
+
+            await asyncio.sleep(node_check_interval)
+
+            for node in list(self.bot.music.nodes.values()):
+
+                if not node.players or self.bot.node_selector.is_usable(node):
+                    self.stranded.pop(node.identifier, None)
+                    continue
+
+                # sem servidores disponíveis: as novas tentativas ocorrem com espera progressiva
+                if (entry := self.stranded.get(node.identifier)) and entry[0] > time.monotonic():
+                    continue
+
+                await self.migrate_players(node)
+
+    async def migrate_player(self, player: CustomPlayer, exclude=()):
+
+        # move o player para outro servidor retomando a música atual na posição em que estava
+        # (fila, volume e pausa são mantidos pelo próprio player, os filtros são reenviados)
+        vc = self.bot.get_channel(player.channel_id)
+
+        node = self.bot.node_selector.best_node(
+            region=vc.rtc_region if vc else None,
+            exclude={player.node.identifier, *exclude}
+        )
+
+        if not node:
+            return
+
+        await player.change_node(node.identifier)
+
+        if player.nightcore:
+            await player.update_filters()
+
+        return node
+
+    async def migrate_players(self, node: wavelink.Node):
+
+        moved = 0
+
+        for player in list(node.players.values()):
+
+            try:
+                new_node = await self.migrate_player(player)
+            except Exception:
+                traceback.print_exc()
+                continue
+
+            if not new_node:
+
+                if entry := self.stranded.get(node.identifier):
+                    entry[1] = min(entry[1] * 2, node_backoff_max)
+                else:
+                    # avisado apenas uma vez enquanto não houver servidores disponíveis
+                    print(f"Não há servidores disponíveis para mover os players do servidor [{node.identifier}].")
+                    entry = self.stranded[node.identifier] = [0, node_check_interval]
+
+                entry[0] = time.monotonic() + entry[1]
+                break
+
+            moved += 1
+
+        else:
+            self.stranded.pop(node.identifier, None)
+
+        if moved:
+            print(f"{moved} player(s) movido(s) do servidor [{node.identifier}].")
+
+        return moved
+
+    async def restore_players(self):
+
+        # restaura os players salvos antes do bot reiniciar
+        await self.bot.wait_until_ready()
+
+        try:
+            snapshots = await self.bot.player_store.load()
+        except Exception:
+            traceback.print_exc()
+            snapshots = []
+
+        if snapshots:
+            try:
+                await self.restore_snapshots(snapshots)
+            except Exception:
+                traceback.print_exc()
+
+    async def restore_snapshots(self, snapshots: list):
+
+        # aguarda algum servidor de música conectar
+        for _ in range(60):
+            if self.bot.node_selector.best_node():
+                break
+            await asyncio.sleep(1)
         else:
-            duration = f"⏰ **⠂Duração:** `{time_format(self.current.duration)}`"
+            print("Não há servidores de música disponíveis para restaurar os players.")
+            return
 
-        txt = f"> {duration}\n" \
-              f"> 💠 **⠂Uploader**: `{self.current.author}`\n" \
-              f"> 🎧 **⠂Pedido por:** {self.current.requester.mention}\n" \
-              f"> 🔊 **⠂Volume:** `{self.volume}%`"
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(player_restore_concurrency)
 
-        txt += "\n"
+        async def restore(snapshot):
+            async with semaphore:
+                try:
+                    return await self.restore_player(*snapshot)
+                except Exception:
+                    traceback.print_exc()
 
-        if self.restrict_mode:
-            txt += "> 🔒 **⠂Modo restrito: `ativado`\n"
+        results = await asyncio.gather(*(restore(s) for s in snapshots))
 
-        if self.command_log:
-            txt += f"> 📈 **⠂Última Interação:** {self.command_log}\n"
+        print(f"{sum(1 for r in results if r)}/{len(snapshots)} player(s) restaurado(s) em "
+              f"{time.perf_counter() - start:.1f}s.")
 
-        if len(self.queue):
+    async def restore_player(self, guild_id: int, state: dict, queue: list):
 
-            txt += "```ansi\n[34;1mPróximas Músicas:[0m```"
-            txt += "\n".join(
-                f"`{n + 1}) [{time_format(t.duration) if t.duration else '🔴 Livestream'}]` [`{fix_characters(t.title, 31)}`]({t.uri})"
-                for n, t
-                in enumerate(itertools.islice(self.queue, 3))
-            )
+        guild = self.bot.get_guild(guild_id)
+        vc = self.bot.get_channel(state["channel_id"])
+        text_channel = self.bot.get_channel(state["text_channel_id"])
 
-            if (qsize := len(self.queue)) > 3:
-                txt += f"\n`╚══════ E mais {qsize - 3} música(s) ══════╝`"
+        if any(guild_id in n.players for n in self.bot.music.nodes.values()):
+            return
 
-        embed.description = txt
+        if not guild or not vc or not text_channel or not [m for m in vc.members if not m.bot]:
+            # servidor/canais removidos ou não há membros no canal de voz: o player salvo é descartado
+            await self.bot.player_store.discard(guild_id)
+            return
 
-        embed.set_image(
-            url="https://cdn.discordapp.com/attachments/554468640942981147/937918500784197632/rainbow_bar.gif"
-        )
+        node = self.bot.node_selector.best_node(region=vc.rtc_region)
 
-        embed_top.set_image(
-            url="https://cdn.discordapp.com/attachments/554468640942981147/937918500784197632/rainbow_bar.gif"
-        )
+        if not node:
+            return
 
-        try:
-            self.view.stop()
-        except:
-            pass
+        current = state["current"]
 
-        self.view = PlayerInteractions(self.ctx)
+        if current:
+            queue = [current[:2]] + queue
 
-        self.view.add_item(
-            discord.ui.Button(emoji="⏯️", custom_id=f"musicplayer_playpause", style=get_button_style(self.paused)))
-        self.view.add_item(discord.ui.Button(emoji="⏮️", custom_id=f"musicplayer_back"))
-        self.view.add_item(discord.ui.Button(emoji="⏭️", custom_id=f"musicplayer_skip", disabled=not self.queue))
-        self.view.add_item(discord.ui.Button(emoji="🇳", custom_id=f"musicplayer_nightcore",
-                                             style=get_button_style(self.nightcore, red=False)))
-        self.view.add_item(discord.ui.Button(
-            emoji=("🔂" if self.loop == "current" else "🔁"),
-            custom_id=f"musicplayer_loop", style=discord.ButtonStyle.grey
-            if not self.loop else discord.ButtonStyle.blurple
-            if self.loop == "current"
-            else discord.ButtonStyle.green)
-        )
-        self.view.add_item(discord.ui.Button(emoji="⏹️", custom_id=f"musicplayer_stop"))
-        self.view.add_item(discord.ui.Button(emoji="⏪", custom_id=f"musicplayer_fastbackward"))
-        self.view.add_item(discord.ui.Button(emoji="⏩", custom_id=f"musicplayer_fastforward"))
-        self.view.add_item(discord.ui.Button(emoji="🔀", custom_id=f"musicplayer_shuffle"))
-        self.view.add_item(discord.ui.Button(emoji="ℹ️", custom_id=f"musicplayer_help"))
+        decoded = await self.decode_tracks(node, [e[0] for e in itertools.chain(state["played"], queue)])
 
-        if not force and self.message:
+        def build(entries):
+            return [CustomTrack(id_, decoded[id_], requester_id=requester_id, guild=guild)
+                    for id_, requester_id in entries if id_ in decoded]
 
-            self.force_edit_message = False
+        tracks = build(queue)
 
-            try:
-                if interaction:
-                    await interaction.response.edit_message(embeds=[embed_top, embed], view=self.view)
-                else:
-                    await self.message.edit(embeds=[embed_top, embed], view=self.view)
-                return
-            except:
-                traceback.print_exc()
-                pass
+        if not tracks:
+            return
 
-        await self.destroy_message(destroy_view=False)
+        player: CustomPlayer = self.bot.music.get_player(guild_id=guild_id, cls=CustomPlayer,
+                                                         text_channel=text_channel, node_id=node.identifier)
 
-        self.last_embed = embed
+        player.loop = state["loop"]
+        player.nightcore = state["nightcore"]
+        player.restrict_mode = state["restrict_mode"]
+        player.dj = [m for m in map(guild.get_member, state["dj"]) if m]
+        player.played.extend(build(state["played"]))
+        player.queue.extend(tracks)
 
-        self.ctx.player = self
+        await player.connect(vc.id)
 
-        self.message = await self.text_channel.send(embeds=[embed_top, embed], view=self.view)
+        # retoma a música atual na posição em que estava
+        position = current[2] if current and current[0] in decoded and not decoded[current[0]].get('isStream') else 0
 
-    async def destroy_message(self, destroy_view=True):
+        async with player.state_lock:
+            await player.play_next(start=position)
 
-        if destroy_view:
+        if state["volume"] != 100:
+            await player.set_volume(state["volume"])
 
-            try:
-                self.view.stop()
-            except:
-                pass
+        if player.nightcore:
+            await player.update_filters()
 
-            self.view = None
+        if state["paused"]:
+            await player.set_pause(True)
 
-        try:
-            await self.message.delete()
-        except:
-            pass
+        return player
 
-        self.last_embed = None
+    async def decode_tracks(self, node: wavelink.Node, ids: list):
 
-        self.message = None
+        # retorna {id: info} das músicas decodificadas (ids inválidos são ignorados).
+        # os ids são enviados em lotes para o /decodetracks do servidor.
+        ids = list(dict.fromkeys(ids))
+        decoded = {}
+        splits = {"remaining": decode_split_limit}
 
-    def is_last_message(self):
+        await asyncio.gather(*(self.decode_chunk(node, ids[i:i + decode_chunk_size], decoded, splits)
+                               for i in range(0, len(ids), decode_chunk_size)))
 
-        try:
-            return self.text_channel.last_message_id == self.message.id
-        except AttributeError:
-            return
+        return decoded
 
-    async def update_message_task(self, interaction=None):
+    async def decode_chunk(self, node: wavelink.Node, ids: list, decoded: dict, splits: dict, depth: int = 0):
 
-        if not interaction:
-            await asyncio.sleep(5)
+        async with self.bot.decode_semaphore:
+            try:
+                async with self.bot.session.post(f"{node.rest_uri}/decodetracks", json=ids,
+                                                 headers={'Authorization': node.password}) as r:
+                    status = r.status
+                    data = await r.json() if status == 200 else None
+            except Exception:
+                traceback.print_exc()
+                return
 
-        try:
-            await self.invoke_np(interaction=interaction)
-        except:
-            traceback.print_exc()
+        if data is not None:
+            for id_, track in zip(ids, data):
+                decoded[id_] = track['info']
+            return
 
-        self.updating_message = None
+        # um id inválido faz o lote inteiro falhar (400/500): o lote é dividido para descartar apenas os ids
+        # inválidos. outros erros (senha incorreta, servidor sobrecarregado etc) não são causados pelos ids.
+        if status not in (400, 500):
+            print(f"Falha ao decodificar músicas no servidor [{node.identifier}] (status: {status}).")
+            return
 
-    def update_message(self, interaction=None):
+        if len(ids) > 1 and depth < decode_split_depth and splits["remaining"] > 0:
+            splits["remaining"] -= 1
+            half = len(ids) // 2
+            await asyncio.gather(self.decode_chunk(node, ids[:half], decoded, splits, depth + 1),
+                                 self.decode_chunk(node, ids[half:], decoded, splits, depth + 1))
 
-        if self.updating_message:
-            return
+    async def save_players(self):
 
-        self.updating_message = self.bot.loop.create_task(self.update_message_task(interaction=interaction))
+        while not self.bot.is_closed():
 
+            await asyncio.sleep(player_store_interval)
 
-##################################
-##### Music Commands/Events ######
-##################################
+            try:
+                await self.bot.player_store.save(self.bot.music.players.values())
+            except Exception:
+                traceback.print_exc()
 
-class Music(commands.Cog, wavelink.WavelinkMixin):
+    async def resolve_tracks(self, query: str):
 
-    def __init__(self, bot: commands.Bot):
+        # retorna (playlistInfo ou None, [(id, info), ...]) para que os CustomTrack sejam criados por requester
+        key = normalize_query(query)
 
-        if not hasattr(bot, 'music'):
-            bot.music = wavelink.Client(bot=bot)
+        if (result := self.bot.track_cache.get(key)) is not None:
+            return result
 
-        self.bot = bot
+        # buscas idênticas simultâneas aguardam a mesma requisição ao lavalink
+        try:
+            task = self.bot.track_lookups[key]
+        except KeyError:
+            task = self.bot.loop.create_task(self.fetch_tracks(query, key))
+            self.bot.track_lookups[key] = task
+            task.add_done_callback(lambda t: self.bot.track_lookups.pop(key, None))
 
-        self.bot.loop.create_task(self.process_nodes())
+        return await asyncio.shield(task)
 
-    async def process_nodes(self):
+    async def fetch_tracks(self, query: str, key: str):
 
-        await self.bot.wait_until_ready()
+        if self.bot.track_store:
+            try:
+                result = await self.bot.track_store.get(key)
+            except Exception:
+                traceback.print_exc()
+                result = None
 
-        if not hasattr(self.bot, 'session') or not self.bot.session:
-            self.bot.session = ClientSession()
+            if result:
+                self.bot.track_cache.put(key, result)
+                return result
 
-        for node in lavalink_servers:
-            self.bot.loop.create_task(self.connect_node(node))
+        tracks = await self.bot.node_selector.get_tracks(query)
 
-    async def connect_node(self, data: dict):
+        if not tracks:
+            return
 
-        data['rest_uri'] = ("https" if data.get('secure') else "http") + f"://{data['host']}:{data['port']}"
+        if isinstance(tracks, list):
+            result = (None, [(t.id, t.info) for t in tracks])
+        else:
+            result = (tracks.data['playlistInfo'], [(t['track'], t['info']) for t in tracks.data['tracks']])
 
-        retries = 1
-        backoff = 7
-        while not self.bot.is_closed():
-            if retries >= 25:
-                print(f"Todas as tentativas de conectar ao servidor [{data['identifier']}] falharam.")
-                return
-            else:
-                try:
-                    async with self.bot.session.get(data['rest_uri'], timeout=10) as r:
-                        break
-                except Exception:
-                    await asyncio.sleep(backoff)
-                    print(f'Falha ao conectar no servidor [{data["identifier"]}], tentativa: {retries}/25')
-                    retries += 1
-                    backoff += 2
-                    continue
+        self.bot.track_cache.put(key, result)
 
-        await self.bot.music.initiate_node(**data)
+        if self.bot.track_store:
+            self.bot.track_store.put(key, result)
+
+        return result
 
     @wavelink.WavelinkMixin.listener("on_websocket_closed")
     async def node_ws_voice_closed(self, node, payload: wavelink.events.WebsocketClosed):
@@ -792,7 +3417,7 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         if payload.code == 4014:
 
-            if player.ctx.me.voice:
+            if player.guild.me.voice:
                 return
             vc = player.bot.get_channel(player.channel_id)
             if vc:
@@ -800,7 +3425,7 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
             else:
                 vcname = ""
             channel = player.text_channel
-            embed = discord.Embed(color=player.ctx.me.color)
+            embed = discord.Embed(color=player.guild.me.color)
             embed.description = f"Conexão perdida com o canal de voz{vcname}..."
             embed.description += "\nO player será finalizado..."
             player.bot.loop.create_task(channel.send(embed=embed))
@@ -812,7 +3437,7 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
             await player.connect(player.channel_id)
             return
 
-        print(f"Erro no canal de voz! server: {player.ctx.guild.name} reason: {payload.reason} | code: {payload.code}")
+        print(f"Erro no canal de voz! server: {player.guild.name} reason: {payload.reason} | code: {payload.code}")
 
     @wavelink.WavelinkMixin.listener('on_track_exception')
     async def wavelink_track_error(self, node, payload: wavelink.TrackException):
@@ -823,44 +3448,80 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
             color=discord.Colour.red())
         await player.text_channel.send(embed=embed)
 
-        if player.locked:
-            return
+        async with player.state_lock:
+
+            if player.state == PlayerState.erroring:
+                return
+
+            player.state = PlayerState.erroring
+            player.current = None
+
+            if payload.error != "This IP address has been blocked by YouTube (429)":
+                player.played.append(player.last_track)
+                await player.play_next()
+                return
 
-        player.current = None
-        if payload.error == "This IP address has been blocked by YouTube (429)":
             player.queue.appendleft(player.last_track)
-        else:
-            player.played.append(player.last_track)
 
-        player.locked = True
-        await asyncio.sleep(6)
-        player.locked = False
-        await player.process_next()
+            if self.bot.node_selector.get_health(node.identifier).record_block():
+                print(f"Servidor [{node.identifier}] bloqueado pelo youtube (429), "
+                      f"ele não receberá players/buscas por {node_block_cooldown}s.")
+
+            # tenta tocar novamente em outro servidor ao invés de repetir no servidor bloqueado
+            # (os demais players do servidor bloqueado são movidos pelo watch_nodes)
+            try:
+                moved = await self.migrate_player(player)
+            except Exception:
+                traceback.print_exc()
+                moved = None
+
+            if moved:
+                await player.play_next()
+            else:
+                player.retry_later()
 
     @wavelink.WavelinkMixin.listener()
     async def on_node_ready(self, node: wavelink.Node):
         print(f'Servidor de música: [{node.identifier}] está pronto para uso!')
 
+    @wavelink.WavelinkMixin.listener()
+    async def on_track_start(self, node: wavelink.Node, payload: wavelink.TrackStart):
+
+        player: CustomPlayer = payload.player
+
+        player.error_retries = 0
+
+        if player.track_end_time is None:
+            return
+
+        self.bot.track_gaps.append((time.perf_counter() - player.track_end_time) * 1000)
+        player.track_end_time = None
+
     @wavelink.WavelinkMixin.listener()
     async def on_track_end(self, node: wavelink.Node, payload: wavelink.TrackEnd):
 
         player: CustomPlayer = payload.player
 
-        if player.locked:
+        if payload.reason not in ("FINISHED", "STOPPED"):
             return
 
-        if payload.reason == "FINISHED":
+        async with player.state_lock:
+
+            if player.state not in (PlayerState.playing, PlayerState.paused):
+                return
+
+            await self.track_finished(player, payload.reason)
+
+    async def track_finished(self, player: CustomPlayer, reason: str):
+
+        if reason == "FINISHED":
             player.command_log = ""
-        elif payload.reason == "STOPPED":
-            player.force_edit_message = True
         else:
-            return
-
-        player.votes.clear()
+            player.force_edit_message = True
 
-        player.locked = True
+        player.track_end_time = time.perf_counter()
 
-        await asyncio.sleep(0.5)
+        player.votes.clear()
 
         if player.last_track:
 
@@ -881,9 +3542,7 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
         elif player.is_previows_music:
             player.is_previows_music = False
 
-        player.locked = False
-
-        await player.process_next()
+        await player.play_next()
 
     async def interaction_message(self, ctx, txt):
         if ctx.interaction:
@@ -910,8 +3569,8 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
     async def track_start(self, node, payload: wavelink.TrackStart):
 
         player: CustomPlayer = payload.player
-        await player.invoke_np(force=not player.is_last_message())
-        player.command_log = ""
+        player.clear_command_log = True
+        self.bot.edit_scheduler.schedule(player, force=not player.is_last_message(), delay=0)
 
     @check_voice()
     @commands.dynamic_cooldown(user_cooldown(2, 5), commands.BucketType.member)
@@ -929,7 +3588,7 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         embed = discord.Embed(color=discord.Colour.red())
 
-        node = self.bot.music.get_best_node()
+        node = self.bot.node_selector.best_node(region=ctx.author.voice.channel.rtc_region)
         if not node:
             embed.description = "Não há servidores de música disponível."
             await ctx.send(embed=embed)
@@ -937,13 +3596,15 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         await ctx.defer()
 
-        tracks = await self.bot.music.get_tracks(query)
+        tracks = await self.resolve_tracks(query)
 
         if not tracks:
             embed.description = "Não houve resultados para sua busca."
             await ctx.send(embed=embed)
             return
 
+        info, tracks = tracks
+
         player: CustomPlayer = self.bot.music.get_player(guild_id=ctx.guild.id, cls=CustomPlayer, ctx=ctx,
                                                          node_id=node.identifier)
 
@@ -951,14 +3612,17 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         embed.colour = ctx.me.color
 
-        if isinstance(tracks, list):
+        if not player.is_connected:
+            await player.connect(ctx.author.voice.channel.id)
 
-            track = CustomTrack(tracks[0].id, tracks[0].info, requester=ctx.author)
+        if info is None:
+
+            track = CustomTrack(*tracks[0], requester=ctx.author)
 
             if position is None:
-                player.queue.append(track)
+                await player.submit(player.queue.append, track)
             else:
-                player.queue.insert(position, track)
+                await player.submit(player.queue.insert, position, track)
                 pos_txt = f" na posição {position + 1} da fila"
 
             embed.description = f"**Música adicionada{pos_txt}:\n[`{track.title}`]({track.uri})**\n\n`{track.author} | " \
@@ -967,35 +3631,27 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         else:
 
-            tracks.tracks = [CustomTrack(t.id, t.info, requester=ctx.author) for t in tracks.tracks]
-
-            info = tracks.data['playlistInfo']
             if (selected := info['selectedTrack']) > 0:
-                tracks.tracks = tracks.tracks[selected:] + tracks.tracks[:selected]
+                tracks = tracks[selected:] + tracks[:selected]
 
-            if position is None or len(tracks.tracks) < 2:
-                for track in tracks.tracks:
-                    player.queue.append(track)
-            else:
-                tracks.tracks.reverse()
-                for track in tracks.tracks:
-                    player.queue.insert(position, track)
+            if position is None or len(tracks) < 2:
+                first = [CustomTrack(*t, requester=ctx.author) for t in tracks[:playlist_preload]]
+
+                def add_tracks():
+                    player.queue.extend(first)
+                    player.queue.extend_lazy(tracks[playlist_preload:], ctx.author)
 
+                await player.submit(add_tracks)
+            else:
+                first = [CustomTrack(*t, requester=ctx.author) for t in tracks]
+                await player.submit(player.queue.splice, position, first)
                 pos_txt = f" na posição {position + 1} da fila"
 
-            embed.description = f"**Playlist adicionada{pos_txt}:**\n[`{info['name']}`]({query})\n\n`[{len(tracks.tracks)}] Música(s)`"
-            embed.set_thumbnail(url=tracks.tracks[0].thumb)
+            embed.description = f"**Playlist adicionada{pos_txt}:**\n[`{info['name']}`]({query})\n\n`[{len(tracks)}] Música(s)`"
+            embed.set_thumbnail(url=first[0].thumb)
 
         await ctx.send(embed=embed)
 
-        if not player.is_connected:
-            await player.connect(ctx.author.voice.channel.id)
-
-        if not player.current:
-            await player.process_next()
-        else:
-            player.update_message()
-
     @check_voice()
     @has_source()
     @is_requester()
@@ -1045,13 +3701,7 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
             await self.interaction_message(ctx, "voltou para o início da música.")
             return
 
-        try:
-            track = player.played.pop()
-        except:
-            track = player.queue.pop()
-            player.last_track = None
-            player.queue.appendleft(player.current)
-        player.queue.appendleft(track)
+        playing = await player.submit(player.previous)
 
         if not ctx.interaction:
             await ctx.message.add_reaction('👍')
@@ -1066,12 +3716,8 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
                 )
             )
 
-        if player.loop == "current":
-            player.loop = False
-        player.is_previows_music = True
-        if not player.current:
-            await player.process_next()
-        else:
+        # sem música tocando a próxima é iniciada após a alteração na fila
+        if playing:
             await player.stop()
 
     @check_voice()
@@ -1210,7 +3856,7 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
             await self.send_message(ctx, embed=embed)
             return
 
-        shuffle(player.queue)
+        await player.submit(player.queue.shuffle)
 
         txt = f"misturou as músicas da fila."
 
@@ -1267,14 +3913,12 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
         player: CustomPlayer = ctx.player
 
         try:
-            track = player.queue[int(item) - 1]
+            track = await player.submit(player.queue.pop, int(item) - 1)
         except IndexError:
             embed.description = f"Você usou a posição de uma música inexistente na fila: {item}\n(Tamanho da fila atual: {len(player.queue)})"
             await ctx.send(embed=embed)
             return
 
-        player.queue.remove(track)
-
         embed = discord.Embed(
             description=f"{ctx.author.mention} removeu a música [`{fix_characters(track.title, limit=25)}`]({track.uri}) da fila.",
             color=discord.Colour.green()
@@ -1298,18 +3942,18 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
             await ctx.send(embed=embed)
             return
 
-        embed.colour = discord.Colour.green()
-        embed.description = f"{ctx.author.mention} **readicionou [{len(player.played)}] música(s) tocada(s) na fila.**"
+        def readd():
+            count = len(player.played)
+            player.queue.splice(len(player.queue), reversed(player.played))
+            player.played.clear()
+            return count
 
-        player.played.reverse()
-        player.queue.extend(player.played)
-        player.played.clear()
+        count = await player.submit(readd)
+
+        embed.colour = discord.Colour.green()
+        embed.description = f"{ctx.author.mention} **readicionou [{count}] música(s) tocada(s) na fila.**"
 
         await ctx.send(embed=embed)
-        if not player.current:
-            await player.process_next()
-        else:
-            player.update_message()
 
     @check_voice()
     @has_source()
@@ -1321,25 +3965,35 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         embed = discord.Embed(color=discord.Colour.red())
 
-        index = get_track_index(ctx, query)
+        player: CustomPlayer = ctx.player
 
-        if index is None:
-            embed.description = f"{ctx.author.mention} **não há músicas na fila com o nome: {query}**"
-            await ctx.reply(embed=embed, mention_author=False)
-            return
+        def skipto():
 
-        player: CustomPlayer = ctx.player
+            # a posição é obtida no momento da alteração (a fila pode ter mudado enquanto o comando aguardava)
+            index = get_track_index(ctx, query)
+
+            if index is None:
+                return
 
-        track = player.queue[index]
+            track = player.queue[index]
 
-        player.queue.append(player.last_track)
-        player.last_track = None
+            player.queue.append(player.last_track)
+            player.last_track = None
 
-        if player.loop == "current":
-            player.loop = False
+            if player.loop == "current":
+                player.loop = False
+
+            if index > 0:
+                player.queue.rotate(0 - (index))
+
+            return track
 
-        if index > 0:
-            player.queue.rotate(0 - (index))
+        track = await player.submit(skipto)
+
+        if track is None:
+            embed.description = f"{ctx.author.mention} **não há músicas na fila com o nome: {query}**"
+            await ctx.reply(embed=embed, mention_author=False)
+            return
 
         await player.stop()
 
@@ -1367,13 +4021,6 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
                 except:
                     position = 1
 
-        index = get_track_index(ctx, query)
-
-        if index is None:
-            embed.description = f"{ctx.author.mention} **não há músicas na fila com o nome: {query}**"
-            await ctx.reply(embed=embed, mention_author=False)
-            return
-
         if position < 0:
             embed.description = f"{ctx.author.mention} **você não pode usar número negativo.**"
             await ctx.reply(embed=embed, mention_author=False)
@@ -1381,11 +4028,23 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         player: CustomPlayer = ctx.player
 
-        track = player.queue[index]
+        def move():
+
+            index = get_track_index(ctx, query)
+
+            if index is None:
+                return
+
+            track = player.queue.pop(index)
+            player.queue.insert(position - 1, track)
+            return track
 
-        player.queue.remove(track)
+        track = await player.submit(move)
 
-        player.queue.insert(position - 1, track)
+        if track is None:
+            embed.description = f"{ctx.author.mention} **não há músicas na fila com o nome: {query}**"
+            await ctx.reply(embed=embed, mention_author=False)
+            return
 
         embed = discord.Embed(
             description=f"{ctx.author.mention} moveu a música [`{fix_characters(track.title, limit=25)}`]({track.uri}) "
@@ -1395,8 +4054,6 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         await ctx.send(embed=embed)
 
-        player.update_message()
-
     @check_voice()
     @has_source()
     @is_dj()
@@ -1407,24 +4064,32 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         embed = discord.Embed(colour=discord.Colour.red())
 
-        index = get_track_index(ctx, query)
+        player: CustomPlayer = ctx.player
+
+        def rotate():
+
+            index = get_track_index(ctx, query)
+
+            if index is None:
+                return None, None
+
+            if index > 0:
+                player.queue.rotate(0 - (index))
+
+            return index, player.queue[0]
+
+        index, track = await player.submit(rotate)
 
         if index is None:
             embed.description = f"{ctx.author.mention} **não há músicas na fila com o nome: {query}**"
             await ctx.reply(embed=embed, mention_author=False)
             return
 
-        player: CustomPlayer = ctx.player
-
-        track = player.queue[index]
-
         if index <= 0:
             embed.description = f"{ctx.author.mention} **a música **[`{track.title}`]({track.uri}) já é a próxima da fila."
             await ctx.reply(embed=embed, mention_author=False)
             return
 
-        player.queue.rotate(0 - (index))
-
         embed = discord.Embed(
             description=f"{ctx.author.mention} rotacionou a fila para a música [`{fix_characters(track.title, limit=25)}`]({track.uri}).",
             color=discord.Colour.green()
@@ -1432,8 +4097,6 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         await ctx.send(embed=embed)
 
-        player.update_message()
-
     @skipto.autocomplete("query")
     @move.autocomplete("query")
     @rotate.autocomplete("query")
@@ -1445,7 +4108,7 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         try:
             player = self.bot.music.players[interaction.guild.id]
-            return [app_commands.Choice(name=t.title[:50], value=t.title) for t in player.queue if not current or current.lower() in t.title.lower()][:20]
+            return [app_commands.Choice(name=t.title[:50], value=t.title) for t in player.queue.search(current, 20)]
         except KeyError:
             return []
 
@@ -1459,17 +4122,14 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
 
         player: CustomPlayer = ctx.player
 
-        op = {"op": "filters", "guildId": str(ctx.guild.id)}
-
         player.nightcore = not player.nightcore
 
         if player.nightcore:
-            op["timescale"] = {"pitch": 1.2, "speed": 1.1, "rate": 1.0}
             txt = "ativou"
         else:
             txt = "desativou"
 
-        await player.node._send(**op)
+        await player.update_filters()
 
         txt = f"{txt} o efeito nightcore."
 
@@ -1511,8 +4171,7 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
             await ctx.send(embed=embed)
             return
 
-        player.queue.clear()
-        player.update_message()
+        await player.submit(player.queue.clear)
 
         embed.colour = discord.Colour.green()
         embed.description = f"{ctx.author.mention} **limpou a fila de música.**"
@@ -1560,6 +4219,38 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
         embed.description = text
         await ctx.send(embed=embed)
 
+    @commands.is_owner()
+    @app_commands.describe(identifier="identificador do servidor de música")
+    @commands.hybrid_command(description="Ativar/Desativar o modo de manutenção de um servidor de música.")
+    async def drain(self, ctx, identifier: str):
+
+        embed = discord.Embed(color=discord.Colour.red())
+
+        node = self.bot.music.get_node(identifier)
+
+        if not node:
+            embed.description = f"**Não há servidor de música com o identificador:** `{identifier}`"
+            await ctx.send(embed=embed)
+            return
+
+        drained = self.bot.node_selector.drained
+
+        if identifier in drained:
+            drained.remove(identifier)
+            embed.colour = discord.Colour.green()
+            embed.description = f"**O servidor** `{identifier}` **voltou a receber players.**"
+            await ctx.send(embed=embed)
+            return
+
+        drained.add(identifier)
+
+        moved = await self.migrate_players(node)
+
+        embed.colour = discord.Colour.green()
+        embed.description = f"**O servidor** `{identifier}` **entrou em manutenção.**\n" \
+                            f"`[{moved}] player(s) movido(s) | [{len(node.players)}] restante(s)`"
+        await ctx.send(embed=embed)
+
     @commands.hybrid_command(aliases=["nodeinfo"], description="Ver informações dos servidores de música.")
     @commands.cooldown(1, 5, commands.BucketType.user)
     async def nodestats(self, ctx):
@@ -1602,15 +4293,75 @@ class Music(commands.Cog, wavelink.WavelinkMixin):
                     if idle:
                         txt += f'`[💤{idle}]`'
 
-            if current_player:
+            health = self.bot.node_selector.get_health(identifier)
+
+            txt = txt.rstrip("\n") + f"\nLatência (REST): `{f'{health.rest_latency:.0f}ms' if health.rest_latency is not None else '---'}`\n" \
+                   f"Ping: `{f'{health.probe_rtt:.0f}ms' if health.probe_rtt is not None else '---'}`" \
+                   f"{' (falhando)' if health.probe_failures else ''}\n" \
+                   f"Falhas: `{health.failure_rate * 100:.0f}%`\n" \
+                   f"Pontuação: `{self.bot.node_selector.score(node):.1f}`"
+
+            if (weight := self.bot.node_selector.weights.get(identifier, 1)) != 1:
+                txt += f" (peso: `{weight}`)"
+
+            if health.blocked:
+                txt += f"\nBloqueado (429): `{time_format((health.blocked_until - time.time()) * 1000)}`"
+
+            if identifier in self.bot.node_selector.drained:
+                status = "🔧"
+            elif health.blocked:
+                status = "⛔"
+            elif not self.bot.node_selector.is_usable(node):
+                status = "⚠️"
+            elif current_player:
                 status = "🌟"
             else:
                 status = "✅" if node.is_available else '❌'
 
             em.add_field(name=f'**{identifier}** `{status}`', value=txt)
 
+        cache = self.bot.track_cache
+        em.add_field(
+            name="**Cache de buscas**",
+            value=f"Buscas: `{len(cache)}/{cache.max_size}`\n"
+                  f"Hits: `{cache.hits}`\n"
+                  f"Misses: `{cache.misses}`\n"
+                  f"Evictions: `{cache.evictions}`"
+        )
+
+        scheduler = self.bot.edit_scheduler
+        em.add_field(
+            name="**Edições de mensagens**",
+            value=f"Na fila: `{len(scheduler)}`\n"
+                  f"Enviadas: `{scheduler.sent}`\n"
+                  f"Mescladas: `{scheduler.merged}`\n"
+                  f"Descartadas: `{scheduler.dropped}`"
+        )
+
+        if gaps := sorted(self.bot.track_gaps):
+            em.add_field(
+                name="**Intervalo entre músicas**",
+                value=f"Média: `{sum(gaps) / len(gaps):.0f}ms`\n"
+                      f"p95: `{gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))]:.0f}ms`\n"
+                      f"Amostras: `{len(gaps)}`"
+            )
+
         await ctx.reply(embed=em, mention_author=False)
 
+    async def cog_unload(self):
+
+        for task in self.store_tasks:
+            task.cancel()
+
+        self.bot.edit_scheduler.close()
+        self.bot.timers.close()
+
+        if self.bot.track_store:
+            await self.bot.track_store.close()
+
+        if self.bot.player_store:
+            await self.bot.player_store.close(self.bot.music.players.values())
+
     async def cog_before_invoke(self, ctx):
 
         try: